@@ -0,0 +1,107 @@
+"""
+Throughput benchmark + correctness check for the Interac parser engine.
+
+    python automation/bench_parser.py            # default 2000 passes over the corpus
+    python automation/bench_parser.py -n 500
+
+Every fixture in automation/fixtures/interac/ is checked against expected.json
+first, so a faster parser that gets answers wrong doesn't look like a win.
+"""
+import argparse
+import base64
+import json
+import os
+import sys
+import time
+from email.message import EmailMessage
+from email.utils import format_datetime, localtime
+
+from interac_parser import parse_eml_bytes, parse_gmail_message
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "interac")
+
+
+def load_corpus():
+    corpus = {}
+    for name in sorted(os.listdir(FIXTURE_DIR)):
+        if name.endswith(".eml"):
+            with open(os.path.join(FIXTURE_DIR, name), "rb") as f:
+                corpus[name] = f.read()
+    return corpus
+
+
+def check_expected(corpus):
+    with open(os.path.join(FIXTURE_DIR, "expected.json")) as f:
+        expected = json.load(f)
+    failures = 0
+    for name, raw in corpus.items():
+        got = parse_eml_bytes(raw)
+        want = expected.get(name)
+        if want is None:
+            print(f"⚠️ {name}: no entry in expected.json")
+            continue
+        wrong = {k: (got[k], v) for k, v in want.items() if got[k] != v}
+        if wrong:
+            failures += 1
+            print(f"❌ {name}: {wrong}")
+        else:
+            print(f"✅ {name}: {got['template']} ({got['confidence']:.2f})")
+    return failures
+
+
+def big_html_email():
+    """
+    Worst case: a huge HTML-only email with no payment in it, so nothing
+    short-circuits. Returned as raw .eml bytes and as a Gmail API message,
+    so both adapters pick the HTML part, cap it and strip it like a real one.
+    """
+    filler = "<tr><td style='padding:4px'>and from and sent you and Amount and </td></tr>" * 20000
+    big_html = f"<html><body><table>{filler}</table></body></html>"
+
+    em = EmailMessage()
+    em['Subject'] = "Interac e-Transfer notice"
+    em['From'] = "notify@payments.interac.ca"
+    em['Date'] = format_datetime(localtime())
+    em.set_content(big_html, subtype='html')
+    gmail_msg = {
+        'id': 'big-html',
+        'internalDate': '0',
+        'snippet': '',
+        'payload': {
+            'mimeType': 'text/html',
+            'headers': [{'name': 'Subject', 'value': em['Subject']}, {'name': 'From', 'value': em['From']}],
+            'body': {'data': base64.urlsafe_b64encode(big_html.encode()).decode()},
+        },
+    }
+    return em.as_bytes(), gmail_msg
+
+
+def bench(label, fn, items, passes):
+    start = time.perf_counter()
+    for _ in range(passes):
+        for item in items:
+            fn(item)
+    elapsed = time.perf_counter() - start
+    total = passes * len(items)
+    print(f"⏱️ {label}: {total} emails in {elapsed:.2f}s -> {total / elapsed:,.0f} emails/sec")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("-n", "--passes", type=int, default=2000)
+    args = parser.parse_args()
+
+    corpus = load_corpus()
+    failures = check_expected(corpus)
+
+    bench("corpus (.eml)", parse_eml_bytes, list(corpus.values()), args.passes)
+
+    big_eml, big_gmail = big_html_email()
+    bench("large html body (.eml)", parse_eml_bytes, [big_eml], max(1, args.passes // 100))
+    bench("large html body (Gmail)", parse_gmail_message, [big_gmail], max(1, args.passes // 100))
+
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""
+Maps Interac senders to doctors.
+
+Rules are (alias, doctor) pairs, read once per run from the "Doctors" tab of
+the payments spreadsheet (columns: Alias, Doctor), or from a local CSV with
+the same two columns when DOCTOR_RULES_FILE is set. The tab is created and
+seeded with DEFAULT_RULES the first time, so staff can add aliases there
+instead of changing code.
+
+All aliases are compiled into one case-insensitive alternation (longest
+alias first), so attributing a payment is a single regex pass no matter how
+many doctors or aliases there are.
+"""
+import csv
+import os
+import re
+
+import gspread
+
+DOCTORS_WORKSHEET = "Doctors"
+DOCTORS_HEADERS = ["Alias", "Doctor"]
+UNKNOWN_DOCTOR = "Unknown"
+
+DEFAULT_RULES = [
+    ("TRIPIC", "Dr. Tripic"),
+    ("CARTAGENA", "Dr. Cartagena"),
+]
+
+
+class DoctorMatcher:
+    def __init__(self, rules):
+        self.doctors = {}
+        for alias, doctor in rules:
+            alias = alias.strip()
+            if alias and doctor.strip():
+                self.doctors.setdefault(alias.upper(), doctor.strip())
+
+        if self.doctors:
+            aliases = sorted(self.doctors, key=len, reverse=True)
+            self.pattern = re.compile(
+                r"(?<!\w)(?:" + "|".join(re.escape(a) for a in aliases) + r")(?!\w)",
+                re.IGNORECASE,
+            )
+        else:
+            self.pattern = None
+
+    def __len__(self):
+        return len(self.doctors)
+
+    def match(self, sender):
+        """Doctor for a sender name, or "Unknown"."""
+        if self.pattern is None or not sender:
+            return UNKNOWN_DOCTOR
+        m = self.pattern.search(sender)
+        return self.doctors[m.group(0).upper()] if m else UNKNOWN_DOCTOR
+
+
+def _rows_to_rules(rows):
+    return [(row[0], row[1]) for row in rows if len(row) > 1]
+
+
+def load_doctor_rules(sh):
+    """Builds the matcher from DOCTOR_RULES_FILE if set, else the Doctors tab."""
+    rules_file = os.environ.get('DOCTOR_RULES_FILE')
+    if rules_file:
+        with open(rules_file, newline='') as f:
+            rows = list(csv.reader(f))
+        return DoctorMatcher(_rows_to_rules(rows[1:]))
+
+    try:
+        ws = sh.worksheet(DOCTORS_WORKSHEET)
+    except gspread.exceptions.WorksheetNotFound:
+        ws = sh.add_worksheet(title=DOCTORS_WORKSHEET, rows=50, cols=2)
+        ws.update(range_name="A1", values=[DOCTORS_HEADERS] + [list(r) for r in DEFAULT_RULES])
+        return DoctorMatcher(DEFAULT_RULES)
+
+    return DoctorMatcher(_rows_to_rules(ws.get_all_values()[1:]))
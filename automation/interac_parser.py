@@ -0,0 +1,235 @@
+"""
+Interac e-Transfer email parser engine.
+
+Every email goes through the same steps:
+  1. pick the body part (plain text preferred, HTML otherwise), capped at MAX_BODY_CHARS
+  2. dispatch on subject / sender domain to a template
+  3. run that template's precompiled extractors, falling back to the generic cascade
+  4. return the payment (amount in int cents) plus a confidence score (0.0 - 1.0)
+
+Templates that can read everything they need from the subject never decode or
+strip the body at all. All patterns use bounded quantifiers so a huge HTML
+body can't make them backtrack.
+"""
+import base64
+import html
+import re
+from datetime import datetime
+from email import message_from_bytes, policy
+from email.utils import parsedate_to_datetime
+
+# Anything past this is footer / legal text; never worth scanning
+MAX_BODY_CHARS = 200_000
+
+INTERAC_DOMAINS = ('payments.interac.ca', 'interac.ca')
+
+# --- PRECOMPILED PATTERNS ---
+AMT = r'((?:\d{1,3}(?:,\d{3})+|\d{1,7})\.\d{2})'
+NAME = r"([A-Za-z][\w .,'&-]{0,80}?)"
+
+_SCRIPT_STYLE_RE = re.compile(r'<(script|style)\b[^>]*>.*?</\1\s*>', re.IGNORECASE | re.DOTALL)
+_BLOCK_TAG_RE = re.compile(r'<(?:br|/p|/div|/tr|/td|/li|/h\d)\b[^>]{0,500}>', re.IGNORECASE)
+_TAG_RE = re.compile(r'<[^>]{0,2000}>')
+_SPACE_RE = re.compile(r'[ \t\r\f\v\xa0]+')
+_BLANK_LINES_RE = re.compile(r'\n\s*\n+')
+_EMAIL_DOMAIN_RE = re.compile(r'@([\w.-]+)')
+
+_RECEIVED_SUBJECT_RE = re.compile(r'received \$\s*' + AMT + r' from ' + NAME + r' and\b', re.IGNORECASE)
+_SENT_YOU_SUBJECT_RE = re.compile(r'sent you money', re.IGNORECASE)
+_SENT_YOU_RE = re.compile(NAME + r' sent you \$?\s*' + AMT, re.IGNORECASE)
+_LABEL_AMOUNT_RE = re.compile(r'Amount:?\s*\$?\s*' + AMT, re.IGNORECASE)
+_LABEL_SENDER_RE = re.compile(r'(?:Sent From|From|Sender):?\s*' + NAME + r'\s*(?:\n|$)', re.IGNORECASE)
+
+# The original cascade, kept as the catch-all
+_GENERIC_AMOUNT_RES = [
+    re.compile(r'\$\s*' + AMT),                                      # $1,234.50
+    re.compile(AMT + r'\s*\(?(?:CAD|CDN)', re.IGNORECASE),           # 910.00 (CAD)
+    re.compile(r'sent you\s+\$?\s*' + AMT, re.IGNORECASE),           # sent you 910.00
+    _LABEL_AMOUNT_RE,                                                # Amount: 910.00
+]
+_GENERIC_SENDER_RE = re.compile(r'received \$[\d.,]{1,15} from ' + NAME + r' and\b', re.IGNORECASE)
+
+
+def _to_cents(amount):
+    """'1,234.50' (as AMT captures it, always two decimals) -> 123450."""
+    return int(amount.replace(',', '').replace('.', ''))
+
+
+# --- HTML / BODY HELPERS ---
+def html_to_text(raw):
+    """Strips tags once so every extractor works on plain text."""
+    raw = _SCRIPT_STYLE_RE.sub(' ', raw)
+    raw = _BLOCK_TAG_RE.sub('\n', raw)
+    raw = _TAG_RE.sub(' ', raw)
+    text = html.unescape(raw)
+    text = _SPACE_RE.sub(' ', text)
+    return _BLANK_LINES_RE.sub('\n', text).strip()
+
+
+def _decode_part(part):
+    data = part.get('body', {}).get('data')
+    if not data:
+        return ""
+    return base64.urlsafe_b64decode(data).decode('utf-8', errors='replace')
+
+
+def _find_part(payload, mime_type):
+    if payload.get('mimeType') == mime_type and payload.get('body', {}).get('data'):
+        return payload
+    for part in payload.get('parts', []):
+        found = _find_part(part, mime_type)
+        if found:
+            return found
+    return None
+
+
+def gmail_body_text(payload, snippet=""):
+    """Plain-text body of a Gmail API payload (plain part preferred)."""
+    part = _find_part(payload, 'text/plain')
+    if part:
+        return _decode_part(part)[:MAX_BODY_CHARS]
+    part = _find_part(payload, 'text/html')
+    if part:
+        return html_to_text(_decode_part(part)[:MAX_BODY_CHARS])
+    # Single-part message without a mimeType we know
+    if payload.get('body', {}).get('data'):
+        return html_to_text(_decode_part(payload)[:MAX_BODY_CHARS])
+    return snippet
+
+
+def _clean_sender(name):
+    name = name.strip(" .,")
+    if "Interac" in name:
+        name = name.replace("Interac", "").strip()
+    return name or "Unknown"
+
+
+# --- TEMPLATES ---
+# Each extractor gets (subject, body) where body is a zero-arg callable, so
+# templates that only need the subject never pay for decoding the body.
+# Returns (amount, sender) with None for anything not found.
+
+def _extract_received_subject(subject, body):
+    m = _RECEIVED_SUBJECT_RE.search(subject)
+    if m:
+        return m.group(1), m.group(2)
+    return None, None
+
+
+def _extract_sent_you(subject, body):
+    m = _SENT_YOU_RE.search(body())
+    if m:
+        return m.group(2), m.group(1)
+    return None, None
+
+
+def _extract_labelled(subject, body):
+    text = body()
+    amount = _LABEL_AMOUNT_RE.search(text)
+    sender = _LABEL_SENDER_RE.search(text)
+    return (amount.group(1) if amount else None), (sender.group(1) if sender else None)
+
+
+def _extract_generic(subject, body):
+    text = body()
+    amount = None
+    for pattern in _GENERIC_AMOUNT_RES:
+        m = pattern.search(text)
+        if m:
+            amount = m.group(1)
+            break
+    sender = _GENERIC_SENDER_RE.search(text) or _GENERIC_SENDER_RE.search(subject)
+    return amount, (sender.group(1) if sender else None)
+
+
+def _from_interac(subject, from_domain):
+    return from_domain.endswith(INTERAC_DOMAINS)
+
+
+# (name, matches(subject, from_domain), extractor, confidence when fully matched)
+TEMPLATES = [
+    ("received_subject", lambda s, d: _RECEIVED_SUBJECT_RE.search(s) is not None, _extract_received_subject, 1.0),
+    ("sent_you", lambda s, d: _SENT_YOU_SUBJECT_RE.search(s) is not None, _extract_sent_you, 0.95),
+    ("interac_labelled", _from_interac, _extract_labelled, 0.9),
+]
+GENERIC_CONFIDENCE = 0.6
+
+
+def parse_email(subject, from_header, body, internal_date_ms):
+    """
+    Core entry point, independent of where the email came from.
+    `body` is either the plain text or a zero-arg callable returning it.
+    Returns a payment dict with 'template' and 'confidence' keys added.
+    """
+    body_fn = body if callable(body) else (lambda: body)
+    cache = {}
+
+    def cached_body():
+        if 'text' not in cache:
+            cache['text'] = body_fn()[:MAX_BODY_CHARS]
+        return cache['text']
+
+    domain_match = _EMAIL_DOMAIN_RE.search(from_header or "")
+    from_domain = domain_match.group(1).lower() if domain_match else ""
+
+    template, amount, sender, confidence = "generic", None, None, 0.0
+    for name, matches, extractor, score in TEMPLATES:
+        if matches(subject, from_domain):
+            amount, sender = extractor(subject, cached_body)
+            if amount:
+                template, confidence = name, score
+                break
+
+    if not amount:
+        amount, generic_sender = _extract_generic(subject, cached_body)
+        sender = sender or generic_sender
+        template, confidence = "generic", (GENERIC_CONFIDENCE if amount else 0.0)
+
+    if amount and not sender:
+        confidence = round(confidence * 0.5, 2)
+
+    dt_object = datetime.fromtimestamp(int(internal_date_ms) / 1000)
+
+    return {
+        "date": dt_object.strftime("%d/%m/%Y %H:%M:%S"),
+        "sender": _clean_sender(sender) if sender else "Unknown",
+        "amount": _to_cents(amount) if amount else 0,
+        "doctor": "Unknown", # Placeholder logic
+        "template": template,
+        "confidence": confidence,
+    }
+
+
+# --- SOURCE ADAPTERS ---
+def parse_gmail_message(msg):
+    """Parses a Gmail API message resource (format=full)."""
+    payload = msg['payload']
+    subject = ""
+    from_header = ""
+    for h in payload.get('headers', []):
+        if h['name'] == 'Subject': subject = h['value']
+        if h['name'] == 'From': from_header = h['value']
+
+    result = parse_email(
+        subject,
+        from_header,
+        lambda: gmail_body_text(payload, msg.get('snippet', '')),
+        msg['internalDate'],
+    )
+    result["message_id"] = msg.get('id')
+    return result
+
+
+def parse_eml_bytes(raw):
+    """Parses a raw RFC 822 email (.eml file), used by the fixture corpus."""
+    em = message_from_bytes(raw, policy=policy.default)
+    internal_date_ms = int(parsedate_to_datetime(em['Date']).timestamp() * 1000)
+
+    def body():
+        part = em.get_body(preferencelist=('plain', 'html'))
+        if part is None:
+            return ""
+        content = part.get_content()[:MAX_BODY_CHARS]
+        return content if part.get_content_subtype() == 'plain' else html_to_text(content)
+
+    return parse_email(str(em['Subject'] or ""), str(em['From'] or ""), body, internal_date_ms)
@@ -0,0 +1,110 @@
+"""
+Local archive of the raw Gmail messages the robot has fetched.
+
+Every message is stored as zlib-compressed JSON (exactly what
+messages.get returned, trimmed to MESSAGE_FIELDS), keyed by a digest of its
+content, with a second table mapping Gmail message IDs to those digests.
+Re-archiving an unchanged message is a no-op, and identical content is
+stored once.
+
+The emails hold names, amounts and bank text, so they never go into the
+Actions cache (SYNC_CACHE_DIR) in the clear:
+  - with MAIL_ARCHIVE_KEY set (a Fernet key, kept in repo secrets), blobs
+    are encrypted, digests are keyed HMACs, and the file lives in the cache
+    dir next to the dedup index, so `sync_robot.py --reparse` can re-run the
+    current parser over everything ever fetched without touching Gmail
+  - without a key, the archive is plain and lives in MAIL_ARCHIVE_DIR
+    (default <repo>/.mail_archive), which isn't cached, e.g. for local runs
+
+Generate a key with:
+    python -c "from cryptography.fernet import Fernet; print(Fernet.generate_key().decode())"
+"""
+import hashlib
+import hmac
+import json
+import os
+import sqlite3
+import zlib
+
+from seen_index import DEFAULT_CACHE_DIR
+
+ARCHIVE_FILE = "mail_archive.sqlite"
+ENCRYPTED_ARCHIVE_FILE = "mail_archive.enc.sqlite"
+DEFAULT_ARCHIVE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".mail_archive")
+
+
+class MailArchive:
+    def __init__(self, path, key=None):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.key = key.encode() if isinstance(key, str) else key
+        self.fernet = None
+        if self.key:
+            from cryptography.fernet import Fernet
+            self.fernet = Fernet(self.key)
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("CREATE TABLE IF NOT EXISTS blobs (digest TEXT PRIMARY KEY, data BLOB NOT NULL)")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS messages ("
+            "message_id TEXT PRIMARY KEY, digest TEXT NOT NULL, internal_date INTEGER)"
+        )
+        self.conn.commit()
+
+    def _encode(self, msg):
+        raw = json.dumps(msg, sort_keys=True, separators=(',', ':')).encode('utf-8')
+        data = zlib.compress(raw, 6)
+        if self.fernet:
+            # A plain hash of the content would let anyone holding the file
+            # confirm a guessed email; a keyed one doesn't
+            return hmac.new(self.key, raw, hashlib.sha256).hexdigest(), self.fernet.encrypt(data)
+        return hashlib.sha256(raw).hexdigest(), data
+
+    def _decode(self, data):
+        if self.fernet:
+            data = self.fernet.decrypt(data)
+        return json.loads(zlib.decompress(data))
+
+    def __len__(self):
+        return self.conn.execute("SELECT COUNT(*) FROM messages").fetchone()[0]
+
+    def add(self, msgs):
+        """Stores fetched messages; returns how many were new or changed."""
+        added = 0
+        for msg in msgs:
+            digest, data = self._encode(msg)
+            self.conn.execute("INSERT OR IGNORE INTO blobs (digest, data) VALUES (?, ?)", (digest, data))
+            cur = self.conn.execute(
+                "INSERT INTO messages (message_id, digest, internal_date) VALUES (?, ?, ?) "
+                "ON CONFLICT(message_id) DO UPDATE SET digest = excluded.digest, "
+                "internal_date = excluded.internal_date WHERE digest != excluded.digest",
+                (msg['id'], digest, int(msg.get('internalDate') or 0)),
+            )
+            added += cur.rowcount
+        self.conn.commit()
+        return added
+
+    def messages(self, batch_size=500):
+        """Yields lists of archived messages, oldest first."""
+        cursor = self.conn.execute(
+            "SELECT b.data FROM messages m JOIN blobs b ON b.digest = m.digest ORDER BY m.internal_date"
+        )
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                return
+            yield [self._decode(r[0]) for r in rows]
+
+
+def open_mail_archive(cache_dir=None, archive_dir=None, key=None):
+    cache_dir = cache_dir or os.environ.get('SYNC_CACHE_DIR', DEFAULT_CACHE_DIR)
+    archive_dir = archive_dir or os.environ.get('MAIL_ARCHIVE_DIR', DEFAULT_ARCHIVE_DIR)
+    key = key or os.environ.get('MAIL_ARCHIVE_KEY')
+
+    # Earlier versions kept a plain archive in the cache dir; don't let it be cached again
+    legacy = os.path.join(cache_dir, ARCHIVE_FILE)
+    if os.path.abspath(cache_dir) != os.path.abspath(archive_dir) and os.path.exists(legacy):
+        os.remove(legacy)
+        print(f"🗑️ Removed the unencrypted mail archive from {cache_dir}.")
+
+    if key:
+        return MailArchive(os.path.join(cache_dir, ENCRYPTED_ARCHIVE_FILE), key=key)
+    return MailArchive(os.path.join(archive_dir, ARCHIVE_FILE))
@@ -0,0 +1,97 @@
+"""
+Per-run instrumentation for the sync robot.
+
+    with metrics.span('gmail_get'):
+        msgs = fetch_messages(...)
+    metrics.count('messages_seen', len(msgs))
+
+At the end of the run, finish() appends one JSON line to METRICS_FILE
+(default: metrics.jsonl in SYNC_CACHE_DIR, next to the dedup index, so the
+history survives between Actions runs) and, when running in GitHub Actions, writes a table to the
+job summary.
+"""
+import json
+import os
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+from seen_index import DEFAULT_CACHE_DIR
+
+METRICS_FILE = "metrics.jsonl"
+
+# Display order for the summary; anything else is listed after these
+STAGES = ['startup', 'gmail_list', 'gmail_get', 'archive', 'parse', 'dedup_read', 'rules_read', 'append', 'state_write']
+COUNTERS = ['messages_seen', 'archived', 'parsed', 'unparsed', 'duplicates', 'appended']
+
+
+class RunMetrics:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.started_at = datetime.now(timezone.utc)
+        self.spans = defaultdict(float)
+        self.counters = Counter()
+        self.mode = None
+
+    @contextmanager
+    def span(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.spans[name] += time.perf_counter() - start
+
+    def count(self, name, n=1):
+        self.counters[name] += n
+
+    def record(self, status, api_usage, first_call_at=None):
+        ordered = [s for s in STAGES if s in self.spans] + sorted(s for s in self.spans if s not in STAGES)
+        return {
+            'ts': self.started_at.isoformat(timespec='seconds'),
+            'mode': self.mode,
+            'status': status,
+            'duration_s': round(time.perf_counter() - self.started, 3),
+            'time_to_first_call_s': round(first_call_at - self.started, 3) if first_call_at else None,
+            'spans_s': {s: round(self.spans[s], 3) for s in ordered},
+            'counters': {c: self.counters.get(c, 0) for c in COUNTERS} | {
+                c: n for c, n in self.counters.items() if c not in COUNTERS},
+            'api': api_usage,
+        }
+
+    def finish(self, status, api_usage, first_call_at=None):
+        rec = self.record(status, api_usage, first_call_at)
+
+        path = os.environ.get('METRICS_FILE') or os.path.join(
+            os.environ.get('SYNC_CACHE_DIR', DEFAULT_CACHE_DIR), METRICS_FILE)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'a') as f:
+            f.write(json.dumps(rec) + "\n")
+
+        summary_path = os.environ.get('GITHUB_STEP_SUMMARY')
+        if summary_path:
+            with open(summary_path, 'a') as f:
+                f.write(github_summary(rec))
+        return rec
+
+
+def github_summary(rec):
+    lines = [
+        f"### 🤖 Payment Sync ({rec['mode']}): {rec['status']} in {rec['duration_s']:.2f}s",
+        "",
+        f"First API call after {rec['time_to_first_call_s']}s",
+        "",
+        "| Stage | Seconds |",
+        "|---|---:|",
+    ]
+    lines += [f"| {stage} | {secs:.3f} |" for stage, secs in rec['spans_s'].items()]
+    lines += ["", "| Counter | Value |", "|---|---:|"]
+    lines += [f"| {name} | {value} |" for name, value in rec['counters'].items()]
+    if rec['api']:
+        lines += ["", "| API | Calls | Units | Retries | Throttled | Failures |", "|---|---:|---:|---:|---:|---:|"]
+        lines += [f"| {api} | {c['calls']} | {c['units']} | {c['retries']} | {c['throttled']} | {c['failures']} |"
+                  for api, c in sorted(rec['api'].items())]
+    return "\n".join(lines) + "\n\n"
+
+
+metrics = RunMetrics()
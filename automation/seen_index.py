@@ -0,0 +1,202 @@
+"""
+Local index of payments already written to the Payments tab.
+
+Keys are Gmail message IDs (column E, "Message ID"). Rows written before that
+column existed, or typed in by hand, are indexed by an exact
+date|amount|sender fingerprint instead, so they still dedup without
+collapsing two equal payments from the same doctor.
+
+The index remembers the last sheet row it has absorbed (`synced_row`), so
+catching up only reads the rows appended since then. If the file is missing
+(e.g. the GitHub Actions cache was evicted) it is rebuilt from the sheet:
+for a normal sync only the trailing TAIL_WINDOW rows, since older rows can't
+collide with new emails; a backfill extends it to the whole tab
+(`covered_from` tracks how far back the index goes).
+
+The file is kept in the Actions cache, so fingerprints (payment dates,
+amounts and patient names) are stored as keyed HMACs, never as text. The key
+is MAIL_ARCHIVE_KEY, the secret that also encrypts the mail archive; without
+it each run uses a throwaway key. An index written with another key (or
+none) is wiped and rebuilt from the sheet.
+
+All reads are explicit A1 ranges over the key columns only (A:C and E).
+"""
+import hashlib
+import hmac
+import os
+import re
+import sqlite3
+
+from emg.money import parse_cents, plain
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".sync_cache")
+INDEX_FILE = "seen_index.sqlite"
+
+MESSAGE_ID_COL = 5  # Column E
+MESSAGE_ID_HEADER = "Message ID"
+
+# Rows a cold-started normal sync indexes; well over a month of payments
+TAIL_WINDOW = 500
+
+_ROW_NUMBER_RE = re.compile(r'(\d+)$')
+
+
+def payment_fingerprint(date, amount, sender):
+    """`amount` in int cents (parsed emails) or as the sheet has it ('1,234.50')."""
+    try:
+        amt = plain(amount if isinstance(amount, int) else parse_cents(amount))
+    except ValueError:
+        amt = str(amount).replace('$', '').replace(',', '').strip()
+    return f"fp:{str(date).strip()}|{amt}|{str(sender).lower().strip()}"
+
+
+def row_keys(row):
+    """Index keys for one Payments row: [Date, Sender, Amount, Doctor, Message ID]."""
+    if len(row) >= MESSAGE_ID_COL and row[MESSAGE_ID_COL - 1].strip():
+        return [row[MESSAGE_ID_COL - 1].strip()]
+    if len(row) > 2 and any(row[:3]):
+        return [payment_fingerprint(row[0], row[2], row[1])]
+    return []
+
+
+def last_row_of_range(a1_range):
+    """'Payments!A120:E125' -> 125"""
+    m = _ROW_NUMBER_RE.search(a1_range or "")
+    return int(m.group(1)) if m else None
+
+
+class SeenIndex:
+    def __init__(self, path, key=None):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.key = key.encode() if isinstance(key, str) else (key or os.urandom(32))
+        self.key_check = hmac.new(self.key, b"seen_index", hashlib.sha256).hexdigest()
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("CREATE TABLE IF NOT EXISTS seen (key TEXT PRIMARY KEY)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT)")
+        self.conn.commit()
+
+        row = self.conn.execute("SELECT value FROM meta WHERE name = 'key_check'").fetchone()
+        if not row or row[0] != self.key_check:
+            # Its fingerprints can't be matched with this key (or are plain text)
+            if len(self):
+                print("🔑 Dedup index was written with another key; rebuilding it from the sheet.")
+            self.clear()
+            self.conn.execute("VACUUM")
+
+    def _stored(self, key):
+        """Message IDs as is; fingerprints as a keyed hash."""
+        if key.startswith("fp:"):
+            return "fp:" + hmac.new(self.key, key.encode('utf-8'), hashlib.sha256).hexdigest()
+        return key
+
+    def _get_meta(self, name, default):
+        row = self.conn.execute("SELECT value FROM meta WHERE name = ?", (name,)).fetchone()
+        return int(row[0]) if row else default
+
+    def _set_meta(self, name, value):
+        self.conn.execute("INSERT OR REPLACE INTO meta (name, value) VALUES (?, ?)", (name, str(value)))
+        self.conn.commit()
+
+    @property
+    def synced_row(self):
+        return self._get_meta('synced_row', 0)
+
+    @synced_row.setter
+    def synced_row(self, value):
+        self._set_meta('synced_row', value)
+
+    @property
+    def covered_from(self):
+        return self._get_meta('covered_from', 2)
+
+    @covered_from.setter
+    def covered_from(self, value):
+        self._set_meta('covered_from', value)
+
+    def __len__(self):
+        return self.conn.execute("SELECT COUNT(*) FROM seen").fetchone()[0]
+
+    def existing(self, keys):
+        """Which of `keys` are already indexed. One indexed lookup per key."""
+        stored = {self._stored(k): k for k in keys}
+        lookups = list(stored)
+        found = set()
+        for start in range(0, len(lookups), 500):
+            chunk = lookups[start:start + 500]
+            placeholders = ",".join("?" * len(chunk))
+            rows = self.conn.execute(f"SELECT key FROM seen WHERE key IN ({placeholders})", chunk)
+            found.update(stored[r[0]] for r in rows)
+        return found
+
+    def add(self, keys):
+        self.conn.executemany("INSERT OR IGNORE INTO seen (key) VALUES (?)", [(self._stored(k),) for k in keys])
+        self.conn.commit()
+
+    def absorb_rows(self, rows, last_row):
+        """Indexes sheet rows and records how far into the sheet we've read."""
+        self.add(k for row in rows for k in row_keys(row))
+        self.synced_row = last_row
+
+    def clear(self):
+        self.conn.execute("DELETE FROM seen")
+        self.conn.execute("DELETE FROM meta")
+        self.conn.execute("INSERT INTO meta (name, value) VALUES ('key_check', ?)", (self.key_check,))
+        self.conn.commit()
+
+
+def read_key_rows(ws, start, end=None):
+    """
+    Reads only the key columns of rows start..end (open-ended if end is None)
+    in one batch_get. Rows come back shaped like full Payments rows, with the
+    Doctor column blank.
+    """
+    end = end or ""
+    abc, ids = ws.batch_get([f"A{start}:C{end}", f"E{start}:E{end}"])
+    rows = []
+    for i in range(max(len(abc), len(ids))):
+        row = list(abc[i]) if i < len(abc) else []
+        row += [""] * (3 - len(row))
+        row += ["", ids[i][0] if i < len(ids) and ids[i] else ""]
+        rows.append(row)
+    return rows
+
+
+def open_seen_index(ws, last_row=None, full=False, cache_dir=None, rebuild=False, key=None):
+    """
+    Opens the local index and brings it up to date with the Payments tab,
+    reading only rows past the last one it has seen.
+
+    last_row: the last data row of the tab, if known (from Sync_State); lets a
+              cold start read just the trailing TAIL_WINDOW rows.
+    full:     make sure every row is indexed (backfills can hit any of them).
+    key:      HMAC key for fingerprints (default: MAIL_ARCHIVE_KEY).
+    """
+    cache_dir = cache_dir or os.environ.get('SYNC_CACHE_DIR', DEFAULT_CACHE_DIR)
+    key = key or os.environ.get('MAIL_ARCHIVE_KEY')
+    index = SeenIndex(os.path.join(cache_dir, INDEX_FILE), key=key)
+    if rebuild:
+        index.clear()
+
+    if index.synced_row == 0:
+        # Cold start: make sure the Message ID column has a header
+        header = ws.row_values(1)
+        if len(header) < MESSAGE_ID_COL or header[MESSAGE_ID_COL - 1] != MESSAGE_ID_HEADER:
+            ws.update(range_name="E1", values=[[MESSAGE_ID_HEADER]])
+        start = 2
+        if last_row and not full:
+            start = max(2, int(last_row) - TAIL_WINDOW + 1)
+        index.covered_from = start
+        index.synced_row = start - 1
+
+    if full and index.covered_from > 2:
+        older = read_key_rows(ws, 2, index.covered_from - 1)
+        index.add(k for row in older for k in row_keys(row))
+        index.covered_from = 2
+        print(f"🗂️ Indexed {len(older)} older sheet rows for backfill.")
+
+    start = index.synced_row + 1
+    rows = read_key_rows(ws, start)
+    if rows:
+        index.absorb_rows(rows, start + len(rows) - 1)
+        print(f"🗂️ Indexed {len(rows)} sheet rows (index now holds {len(index)} keys).")
+    return index
@@ -1,18 +1,46 @@
 import os
+import sys
 import json
-import base64
-import re
+import argparse
+import csv
+import multiprocessing
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 from datetime import datetime
 from google.auth.transport.requests import Request
 from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
+import google_auth_httplib2
+import httplib2
+from googleapiclient.errors import HttpError
 import gspread
 
+# Shared code lives in the repo root package `emg/`
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from emg.google_api import (
+    gmail_service, sheets_client_from_dict, call_with_retry, is_retryable,
+    backoff_delay, usage_summary, replay_dir, quota, MAX_RETRIES, GMAIL_MESSAGE_GET_COST,
+)
+from emg.money import money, parse_cents, sheet_text
+from doctor_rules import load_doctor_rules
+from interac_parser import parse_gmail_message, gmail_body_text
+from mail_archive import open_mail_archive
+from metrics import metrics
+from seen_index import open_seen_index, payment_fingerprint, row_keys, last_row_of_range, DEFAULT_CACHE_DIR
+from sync_state import open_state_worksheet, load_state, save_state
+
 # Scopes
 SCOPES = ['https://www.googleapis.com/auth/gmail.readonly']
 
-def get_gmail_service():
+QUERY = 'subject:"Interac e-Transfer" "deposited"'
+SHEET_NAME = "EMG Payments Kitchener"
+WORKSHEET_NAME = "Payments"
+
+# Labels the search query never returns, so history results skip them too
+EXCLUDED_LABELS = {'SPAM', 'TRASH'}
+
+def get_gmail_credentials():
     """Authenticates using Environment Variables (GitHub Secrets)"""
     creds = None
     
@@ -27,9 +55,9 @@ def get_gmail_service():
         except Exception as e:
             print(f"Error loading token from env: {e}")
 
-    # If valid, return service
+    # If valid, return them
     if creds and creds.valid:
-        return build('gmail', 'v1', credentials=creds)
+        return creds
 
     # If expired, try to refresh
     if creds and creds.expired and creds.refresh_token:
@@ -37,7 +65,7 @@ def get_gmail_service():
             creds.refresh(Request())
             # Note: We can't save the new token back to GitHub Secrets easily from here, 
             # but it allows the run to proceed.
-            return build('gmail', 'v1', credentials=creds)
+            return creds
         except Exception as e:
             print(f"Token expired and refresh failed: {e}")
             return None
@@ -45,185 +73,715 @@ def get_gmail_service():
     print("No valid credentials found.")
     return None
 
-def parse_interac_email(service, msg_id):
+def get_gmail_service(creds=None):
+    if replay_dir():
+        return gmail_service(None)
+    creds = creds or get_gmail_credentials()
+    if not creds:
+        return None
+    return gmail_service(creds)
+
+# How far before the high-water mark a bounded search starts, to catch
+# emails that were delivered late or committed out of order (seconds)
+HIGH_WATER_OVERLAP = 2 * 24 * 3600
+
+def search_query(state):
+    """QUERY, bounded to just before the newest email already committed."""
+    high_water_ms = int(state.get('high_water_ms') or 0)
+    if not high_water_ms:
+        return QUERY
+    return f"{QUERY} after:{high_water_ms // 1000 - HIGH_WATER_OVERLAP}"
+
+def advance_high_water(state, msgs):
+    """Moves the high-water mark to the newest of `msgs` (saved by the caller)."""
+    newest = max((int(m.get('internalDate') or 0) for m in msgs), default=0)
+    if newest > int(state.get('high_water_ms') or 0):
+        state['high_water_ms'] = newest
+
+def list_recent_message_ids(service, query=QUERY, max_results=20):
+    """
+    Full search: the newest matching emails, regardless of what we saw before.
+    With max_results=None every page is read (only sensible for a bounded query).
+    """
+    ids = []
+    page_token = None
+    while True:
+        page_size = 500 if max_results is None else min(500, max_results - len(ids))
+        results = service.users().messages().list(
+            userId='me', q=query, maxResults=page_size, pageToken=page_token
+        ).execute()
+        ids += [m['id'] for m in results.get('messages', [])]
+        page_token = results.get('nextPageToken')
+        if not page_token or (max_results is not None and len(ids) >= max_results):
+            return ids
+
+def list_added_message_ids(service, start_history_id):
+    """
+    Incremental listing via the history API.
+    Returns (message_ids, latest_history_id), or None if the cursor has expired
+    (Gmail only keeps about a week of history) and a full search is needed.
+    """
+    message_ids = []
+    seen = set()
+    latest_history_id = start_history_id
+    page_token = None
     try:
-        msg = service.users().messages().get(userId='me', id=msg_id).execute()
-        payload = msg['payload']
-        headers = payload.get("headers")
-        
-        subject = "Unknown"
-        sender = "Unknown"
-        email_date = datetime.now()
-
-        for h in headers:
-            if h['name'] == 'Subject': subject = h['value']
-            if h['name'] == 'From': sender = h['value']
-            if h['name'] == 'Date': 
-                # Basic parsing, might need adjustment for strict formats
-                try:
-                    # E.g. "Fri, 23 Dec 2025 14:00:00 -0500"
-                    # Simplified parsing or usage of dateutil would be better but keeping deps low
-                    pass 
-                except:
-                    pass
-
-        # Recursive function to find body
-        def get_body_from_payload(payload):
-            if 'body' in payload and 'data' in payload['body']:
-                return base64.urlsafe_b64decode(payload['body']['data']).decode('utf-8')
-            
-            if 'parts' in payload:
-                for part in payload['parts']:
-                    if part['mimeType'] == 'text/html':
-                        return get_body_from_payload(part)
-                    if part['mimeType'] == 'text/plain': # Fallback
-                        return get_body_from_payload(part)
-                    if 'parts' in part: # Nested parts
-                         res = get_body_from_payload(part)
-                         if res: return res
-            return ""
-
-        decoded_data = get_body_from_payload(payload)
-        if not decoded_data: decoded_data = msg.get('snippet', '')
-        
-        # Simple extraction (Text based, ignoring HTML tags for regex)
-        # Using the same logic as the Sync App
-        
-        # Simple extraction (Text based, ignoring HTML tags for regex)
-        # Using the same logic as the Sync App
-        # Remove HTML tags logic (rudimentary but avoiding bs4 dependency if not needed? Actually bs4 is better)
-        # Since we added bs4 to requirements, let's use it or stick to decoded_data if simple.
-        # But for consistency, let's upgrade regex here too.
-        
-        # Pattern 1: $1,234.50
-        amount_match = re.search(r'\$\s*(\d{1,3}(?:,\d{3})*(?:\.\d{2}))', decoded_data)
-        
-        # Pattern 2: "910.00 (CAD)" or "910.00 CAD"
-        if not amount_match:
-             amount_match = re.search(r'(\d{1,3}(?:,\d{3})*(?:\.\d{2}))\s*(?:CAD|CDN)', decoded_data, re.IGNORECASE)
-
-        # Pattern 3: "sent you 910.00"
-        if not amount_match:
-             amount_match = re.search(r'sent you\s+\$?\s*(\d{1,3}(?:,\d{3})*(?:\.\d{2}))', decoded_data, re.IGNORECASE)
-
-        # Pattern 4: "Amount: 910.00"
-        if not amount_match:
-             amount_match = re.search(r'Amount:?\s*\$?\s*(\d{1,3}(?:,\d{3})*(?:\.\d{2}))', decoded_data, re.IGNORECASE)
-        
-        amount = amount_match.group(1) if amount_match else "0.00"
-
-        # Regex for Sender
-        sender_match = re.search(r"received \$[\d\.,]+ from (.*?) and", decoded_data, re.IGNORECASE)
-        if not sender_match:
-             sender_match = re.search(r"received \$[\d\.,]+ from (.*?) and", subject, re.IGNORECASE)
-             
-        sender_name = sender_match.group(1).strip() if sender_match else "Unknown"
-        if "Interac" in sender_name: sender_name = sender_name.replace("Interac", "").strip()
-
-        # Date from InternalDate (more reliable than header for sorting)
-        internal_date = int(msg['internalDate']) / 1000
-        dt_object = datetime.fromtimestamp(internal_date)
-        formatted_date = dt_object.strftime("%d/%m/%Y %H:%M:%S")
-
-        print(f"Parsed: {formatted_date} | {sender_name} | ${amount}")
-
-        return {
-            "date": formatted_date,
-            "sender": sender_name,
-            "amount": amount,
-            "doctor": "Unknown" # Placeholder logic
-        }
+        while True:
+            resp = service.users().history().list(
+                userId='me',
+                startHistoryId=start_history_id,
+                historyTypes='messageAdded',
+                pageToken=page_token
+            ).execute()
+            for record in resp.get('history', []):
+                for added in record.get('messagesAdded', []):
+                    m = added['message']
+                    if EXCLUDED_LABELS.intersection(m.get('labelIds', [])):
+                        continue
+                    if m['id'] not in seen:
+                        seen.add(m['id'])
+                        message_ids.append(m['id'])
+            latest_history_id = resp.get('historyId', latest_history_id)
+            page_token = resp.get('nextPageToken')
+            if not page_token:
+                break
+    except HttpError as e:
+        if e.resp.status == 404:
+            return None
+        raise
+    return message_ids, latest_history_id
+
+def get_current_history_id(service):
+    return service.users().getProfile(userId='me').execute()['historyId']
+
+# Gmail accepts up to 100 calls per batch, but large batches tend to get
+# throttled per-user, so we stay at half that.
+BATCH_SIZE = 50
+# Only what parse_interac_email / is_interac_deposit read
+MESSAGE_FIELDS = 'id,internalDate,snippet,payload'
+
+def fetch_messages(service, msg_ids, batch_size=BATCH_SIZE, http=None, failed=None):
+    """
+    Fetches many messages with Gmail batch requests (one HTTP round-trip per
+    batch_size ids). Returns the messages in the same order as msg_ids,
+    skipping any that failed. Pass `http` when calling from a worker thread.
+    Items throttled inside a batch are retried in a later batch with backoff.
+    IDs that still fail are appended to `failed` if given, except 404s (the
+    message is gone, so retrying later won't help).
+    """
+    batch_size = min(batch_size, 100)
+    fetched = {}
+
+    for start in range(0, len(msg_ids), batch_size):
+        pending = msg_ids[start:start + batch_size]
+        for attempt in range(MAX_RETRIES + 1):
+            retry_ids = []
+            last_error = []
+
+            def on_response(request_id, response, exception):
+                if exception is None:
+                    fetched[request_id] = response
+                elif is_retryable(exception) and attempt < MAX_RETRIES:
+                    retry_ids.append(request_id)
+                    last_error[:] = [exception]
+                else:
+                    print(f"Error fetching {request_id}: {exception}")
+                    if failed is not None and not (isinstance(exception, HttpError) and exception.resp.status == 404):
+                        failed.append(request_id)
+
+            batch = service.new_batch_http_request(callback=on_response)
+            for msg_id in pending:
+                batch.add(
+                    service.users().messages().get(userId='me', id=msg_id, fields=MESSAGE_FIELDS),
+                    request_id=msg_id
+                )
+            call_with_retry('gmail', lambda: batch.execute(http=http), cost=len(pending) * GMAIL_MESSAGE_GET_COST)
+
+            if not retry_ids:
+                break
+            pending = retry_ids
+            time.sleep(backoff_delay(attempt, last_error[0] if last_error else None))
+
+    return [fetched[m] for m in msg_ids if m in fetched]
+
+def fetch_messages_concurrently(service, creds, msg_ids, workers=4, batch_size=BATCH_SIZE, failed=None):
+    """
+    Same as fetch_messages, but runs up to `workers` batches at once.
+    httplib2 connections are not thread-safe, so each worker gets its own.
+    """
+    local = threading.local()
+
+    def fetch_chunk(chunk):
+        if not hasattr(local, 'http'):
+            local.http = google_auth_httplib2.AuthorizedHttp(creds, http=httplib2.Http()) if creds else None
+        return fetch_messages(service, chunk, batch_size=batch_size, http=local.http, failed=failed)
+
+    chunks = [msg_ids[i:i + batch_size] for i in range(0, len(msg_ids), batch_size)]
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        results = pool.map(fetch_chunk, chunks)
+    return [msg for chunk in results for msg in chunk]
+
+def is_interac_deposit(msg):
+    """
+    Client-side version of QUERY, for messages that came from the history API.
+    Gmail's search finds "deposited" anywhere in the email, so the body is
+    checked too (decoded only when the subject and snippet don't have it).
+    """
+    payload = msg.get('payload', {})
+    subject = next((h['value'] for h in payload.get('headers', []) if h['name'] == 'Subject'), "")
+    if "interac e-transfer" not in subject.lower():
+        return False
+    if "deposited" in subject.lower() or "deposited" in msg.get('snippet', '').lower():
+        return True
+    return "deposited" in gmail_body_text(payload).lower()
+
+# Below this the parser is guessing; better to flag it for review than write a bad row
+MIN_CONFIDENCE = 0.3
+
+def parse_interac_email(msg):
+    msg_id = msg.get('id')
+    try:
+        p = parse_gmail_message(msg)
+        if p['confidence'] < MIN_CONFIDENCE:
+            print(f"⚠️ Could not parse {msg_id} (template={p['template']}, confidence={p['confidence']}); flagged for review")
+            return None
+        print(f"Parsed: {p['date']} | {p['sender']} | {money(p['amount'])} ({p['template']}, {p['confidence']:.2f})")
+        return p
 
     except Exception as e:
         print(f"Error parsing {msg_id}: {e}")
         return None
 
-def get_google_sheet_worksheet():
+def flag_for_review(state, msgs, found_payments):
+    """
+    Records the emails among `msgs` that didn't yield a payment (too low a
+    confidence, or a parse error) in Sync_State 'needs_review', so a person
+    can look at them: the cursors move past them, and a new deposit format
+    would otherwise go unnoticed. Clear the cell once they're dealt with.
+    """
+    parsed = {p['message_id'] for p in found_payments}
+    dropped = [m['id'] for m in msgs if m['id'] not in parsed]
+    metrics.count('unparsed', len(dropped))
+    if dropped:
+        flagged = [m for m in state.get('needs_review', '').split(',') if m]
+        state['needs_review'] = ",".join(dict.fromkeys(flagged + dropped))
+        print(f"👀 {len(dropped)} emails need a manual look (Sync_State 'needs_review'): {', '.join(dropped)}")
+
+def _sheet_key_cache():
+    return os.path.join(os.environ.get('SYNC_CACHE_DIR', DEFAULT_CACHE_DIR), "sheet_keys.json")
+
+def open_payments_spreadsheet(gc):
+    """
+    Opens the spreadsheet by key (one Sheets call) instead of by name, which
+    is a Drive search. The key comes from PAYMENTS_SHEET_KEY, or from the
+    cache dir where it's remembered after the first by-name open.
+    """
+    cache_path = _sheet_key_cache()
+    cached = {}
+    if os.path.exists(cache_path):
+        with open(cache_path) as f:
+            cached = json.load(f)
+
+    key = os.environ.get('PAYMENTS_SHEET_KEY') or cached.get(SHEET_NAME)
+    if key:
+        try:
+            return gc.open_by_key(key)
+        except gspread.exceptions.SpreadsheetNotFound:
+            print(f"⚠️ Spreadsheet key {key} not found, searching by name.")
+
+    sh = gc.open(SHEET_NAME)
+    cached[SHEET_NAME] = sh.id
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    with open(cache_path, 'w') as f:
+        json.dump(cached, f)
+    print(f"💡 Set PAYMENTS_SHEET_KEY={sh.id} to skip the name lookup.")
+    return sh
+
+def get_google_spreadsheet():
     """Connects using GCP Service Account JSON from Env Var"""
-    gcp_json = os.environ.get('GCP_JSON')
+    gcp_json = os.environ.get('GCP_JSON') or ('{}' if replay_dir() else None)
     if gcp_json:
         try:
             creds_dict = json.loads(gcp_json)
-            gc = gspread.service_account_from_dict(creds_dict)
-            sh = gc.open("EMG Payments Kitchener")
-            ws = sh.worksheet("Payments")
-            return ws
+            gc = sheets_client_from_dict(creds_dict)
+            return open_payments_spreadsheet(gc)
         except Exception as e:
             print(f"Error connecting to Google Sheets: {e}")
     return None
 
-def main():
+def build_new_rows(found_payments, index, doctors):
+    """
+    Turns parsed payments into sheet rows, skipping ones already recorded.
+    Only the new messages' keys are looked up; the sheet itself isn't read.
+    """
+    keys = set()
+    for p in found_payments:
+        keys.add(p['message_id'])
+        keys.add(payment_fingerprint(p['date'], p['amount'], p['sender']))
+    already = index.existing(keys)
+
+    new_rows = []
+    for p in found_payments:
+        fingerprint = payment_fingerprint(p['date'], p['amount'], p['sender'])
+        if p['message_id'] in already or fingerprint in already:
+            continue
+
+        doctor = doctors.match(p['sender'])
+        new_rows.append([p['date'], p['sender'], sheet_text(p['amount']), doctor, p['message_id']])
+        already.add(p['message_id']) # Prevent internal dupes
+        print(f"✨ NEW ENTRY: {p['sender']} - {money(p['amount'])}")
+    return new_rows
+
+def append_payments(ws, index, new_rows, state):
+    """
+    One bulk append, then record the new rows in the dedup index and the
+    tab's last row in the state (saved by the caller). The append isn't
+    retried after a timeout or 5xx (it may have gone through); the error
+    ends the run before the cursors move, and the next run's index
+    catch-up sees any rows that did land.
+    """
+    resp = ws.append_rows(new_rows)
+    updated_range = resp.get('updates', {}).get('updatedRange', '')
+    last_row = last_row_of_range(updated_range)
+    first_row = last_row - len(new_rows) + 1 if last_row else None
+    if first_row == index.synced_row + 1:
+        index.absorb_rows(new_rows, last_row)
+    else:
+        # Someone else appended in between; the next catch-up re-reads those rows
+        index.add(k for row in new_rows for k in row_keys(row))
+    if last_row:
+        state['payments_last_row'] = last_row
+
+def pending_ids(state):
+    """Message IDs that failed to fetch on an earlier run (Sync_State 'pending_ids')."""
+    return [m for m in state.get('pending_ids', '').split(',') if m]
+
+def set_pending_ids(state, msg_ids):
+    state['pending_ids'] = ",".join(dict.fromkeys(msg_ids))
+    if msg_ids:
+        metrics.count('fetch_failed', len(msg_ids))
+        print(f"⚠️ {len(msg_ids)} emails could not be fetched; they will be retried next run.")
+
+def run_incremental(service, sh, state_ws, state, rebuild_index=False):
+    # The cursors below move past these; fetch them again before anything else
+    retry_ids = pending_ids(state)
+    if retry_ids:
+        print(f"🔁 Retrying {len(retry_ids)} emails that failed to fetch last run.")
+
+    # Find candidate emails: incremental if we have a cursor, full search otherwise
+    incremental = None
+    if state.get('history_id'):
+        print(f"🔁 Checking mailbox history since {state['history_id']}")
+        with metrics.span('gmail_list'):
+            incremental = list_added_message_ids(service, state['history_id'])
+        if incremental is None:
+            print("⚠️ History cursor expired, falling back to full search.")
+
+    if incremental is not None:
+        message_ids, new_history_id = incremental
+        if not message_ids and not retry_ids:
+            print("✅ No mailbox changes since last run.")
+            if new_history_id != state['history_id']:
+                state['history_id'] = new_history_id
+                with metrics.span('state_write'):
+                    save_state(state_ws, state)
+            return 0
+        print(f"📧 {len(message_ids)} new emails since last run.")
+    else:
+        # Take the cursor BEFORE listing so nothing can slip in between
+        with metrics.span('gmail_list'):
+            new_history_id = get_current_history_id(service)
+            query = search_query(state)
+            print(f"🔍 Searching: {query}")
+            # A bounded search is small, so read all of it; unbounded, just the newest
+            message_ids = list_recent_message_ids(service, query, max_results=None if query != QUERY else 20)
+        print(f"📧 Found {len(message_ids)} emails.")
+
+    message_ids = list(dict.fromkeys(retry_ids + message_ids))
+    failed = []
+    with metrics.span('gmail_get'):
+        msgs = fetch_messages(service, message_ids, failed=failed)
+    metrics.count('messages_seen', len(msgs))
+    if incremental is not None:
+        msgs = [msg for msg in msgs if is_interac_deposit(msg)]
+
+    with metrics.span('archive'):
+        metrics.count('archived', open_mail_archive().add(msgs))
+
+    found_payments = []
+    with metrics.span('parse'):
+        for msg in msgs:
+            p = parse_interac_email(msg)
+            if p:
+                found_payments.append(p)
+    metrics.count('parsed', len(found_payments))
+    flag_for_review(state, msgs, found_payments)
+
+    new_rows = []
+    if found_payments:
+        with metrics.span('dedup_read'):
+            ws = sh.worksheet(WORKSHEET_NAME)
+            index = open_seen_index(ws, last_row=state.get('payments_last_row'), rebuild=rebuild_index)
+        with metrics.span('rules_read'):
+            doctors = load_doctor_rules(sh)
+        new_rows = build_new_rows(found_payments, index, doctors)
+        metrics.count('duplicates', len(found_payments) - len(new_rows))
+
+    if new_rows:
+        with metrics.span('append'):
+            append_payments(ws, index, new_rows, state)
+        metrics.count('appended', len(new_rows))
+        print(f"✅ Automatically added {len(new_rows)} payments to Sheet.")
+    else:
+        print("✅ No new payments found.")
+
+    # Only advance the cursors once the rows are safely in the sheet; what
+    # failed to fetch is kept in pending_ids, since the cursors now skip it
+    state['history_id'] = new_history_id
+    set_pending_ids(state, failed)
+    advance_high_water(state, msgs)
+    with metrics.span('state_write'):
+        save_state(state_ws, state)
+    return len(new_rows)
+
+# Watch mode polling bounds (seconds)
+WATCH_MIN_INTERVAL = 15
+WATCH_MAX_INTERVAL = 300
+
+def run_watch(service, sh, state_ws, state, max_runtime=None):
+    """
+    Keeps the Gmail and Sheets clients warm and polls the mailbox historyId
+    (one getProfile call) instead of re-running the whole sync. The interval
+    doubles while nothing changes and snaps back to the minimum after activity.
+    """
+    deadline = time.monotonic() + max_runtime if max_runtime else None
+    interval = WATCH_MIN_INTERVAL
+    print(f"👀 Watching mailbox (every {WATCH_MIN_INTERVAL}-{WATCH_MAX_INTERVAL}s)...")
+
+    while True:
+        try:
+            metrics.count('watch_polls')
+            with metrics.span('gmail_list'):
+                history_id = get_current_history_id(service)
+            if history_id != state.get('history_id'):
+                run_incremental(service, sh, state_ws, state)
+                interval = WATCH_MIN_INTERVAL
+            else:
+                interval = min(interval * 2, WATCH_MAX_INTERVAL)
+        except Exception as e:
+            # A bad poll shouldn't end the watch; wait longer and try again
+            print(f"⚠️ Watch poll failed: {e}")
+            interval = WATCH_MAX_INTERVAL
+
+        if deadline is not None:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                print("⏹️ Watch time limit reached.")
+                return
+            interval = min(interval, remaining)
+        time.sleep(interval)
+
+BACKFILL_PAGE_SIZE = 200
+BACKFILL_WORKERS = 4
+# Pages fetched ahead of the parser; bounds memory to roughly this many pages
+BACKFILL_PREFETCH_PAGES = 2
+PARSE_WORKERS = os.cpu_count() or 2
+
+def iter_backfill_pages(service, creds, query, page_token):
+    """
+    Fetch stage: yields (raw_messages, failed_ids, next_page_token) for each result page.
+    Runs on the prefetch thread, so its spans overlap the parse stage's.
+    """
+    while True:
+        with metrics.span('gmail_list'):
+            resp = service.users().messages().list(
+                userId='me', q=query, maxResults=BACKFILL_PAGE_SIZE, pageToken=page_token
+            ).execute()
+        message_ids = [m['id'] for m in resp.get('messages', [])]
+        failed = []
+        with metrics.span('gmail_get'):
+            msgs = fetch_messages_concurrently(service, creds, message_ids, workers=BACKFILL_WORKERS, failed=failed)
+        page_token = resp.get('nextPageToken')
+        yield msgs, failed, page_token
+        if not page_token:
+            return
+
+def prefetch(iterable, depth):
+    """
+    Runs `iterable` in a background thread, keeping at most `depth` items
+    waiting in a queue. Exceptions are re-raised in the consuming thread.
+    """
+    q = queue.Queue(maxsize=depth)
+    done = object()
+
+    def produce():
+        try:
+            for item in iterable:
+                q.put(item)
+            q.put(done)
+        except BaseException as e:
+            q.put(e)
+
+    threading.Thread(target=produce, daemon=True).start()
+    while True:
+        item = q.get()
+        if item is done:
+            return
+        if isinstance(item, BaseException):
+            raise item
+        yield item
+
+def parse_in_pool(pool, msgs):
+    """Parse stage: CPU-bound parsing across processes, merged oldest-first."""
+    msgs = sorted(msgs, key=lambda m: int(m['internalDate']))
+    chunksize = max(1, len(msgs) // (PARSE_WORKERS * 4))
+    return [p for p in pool.map(parse_interac_email, msgs, chunksize=chunksize) if p]
+
+def run_backfill(service, creds, sh, state_ws, state, since, rebuild_index=False):
+    """
+    Pages through every matching email since `since` (YYYY-MM-DD).
+    Runs as a pipeline: a background thread fetches pages into a bounded
+    queue while a process pool parses the previous one. After each page the
+    rows are appended in one call and the next page token is checkpointed in
+    Sync_State, so re-running the same command resumes.
+    """
+    query = f"{QUERY} after:{since.strftime('%Y/%m/%d')}"
+    since_key = since.strftime('%Y-%m-%d')
+
+    page_token = None
+    if state.get('backfill_since') == since_key and state.get('backfill_page_token'):
+        page_token = state['backfill_page_token']
+        print(f"⏯️ Resuming backfill since {since_key} (page {state.get('backfill_pages', '?')})")
+    else:
+        state['backfill_pages'] = 0
+    state['backfill_since'] = since_key
+
+    with metrics.span('dedup_read'):
+        ws = sh.worksheet(WORKSHEET_NAME)
+        index = open_seen_index(ws, last_row=state.get('payments_last_row'), full=True, rebuild=rebuild_index)
+    with metrics.span('rules_read'):
+        doctors = load_doctor_rules(sh)
+    archive = open_mail_archive()
+    print(f"🔍 Backfilling: {query}")
+
+    total_added = 0
+    # spawn, not fork: forking while the fetch thread holds locks can hang the workers
+    with ProcessPoolExecutor(max_workers=PARSE_WORKERS, mp_context=multiprocessing.get_context('spawn')) as pool:
+        pages = iter_backfill_pages(service, creds, query, page_token)
+        for msgs, failed, page_token in prefetch(pages, BACKFILL_PREFETCH_PAGES):
+            metrics.count('messages_seen', len(msgs))
+            with metrics.span('archive'):
+                metrics.count('archived', archive.add(msgs))
+            with metrics.span('parse'):
+                found_payments = parse_in_pool(pool, msgs)
+            metrics.count('parsed', len(found_payments))
+            flag_for_review(state, msgs, found_payments)
+
+            new_rows = build_new_rows(found_payments, index, doctors)
+            metrics.count('duplicates', len(found_payments) - len(new_rows))
+            if new_rows:
+                with metrics.span('append'):
+                    append_payments(ws, index, new_rows, state)
+                metrics.count('appended', len(new_rows))
+                total_added += len(new_rows)
+
+            # The next sync's run_incremental retries these
+            if failed:
+                set_pending_ids(state, pending_ids(state) + failed)
+            advance_high_water(state, msgs)
+            state['backfill_pages'] = int(state.get('backfill_pages') or 0) + 1
+            state['backfill_page_token'] = page_token or ""
+            with metrics.span('state_write'):
+                save_state(state_ws, state)
+            print(f"📄 Page {state['backfill_pages']}: {len(msgs)} emails, {len(new_rows)} new payments.")
+
+    state['backfill_since'] = ""
+    state['backfill_pages'] = ""
+    save_state(state_ws, state)
+    print(f"✅ Backfill complete. Added {total_added} payments to Sheet.")
+
+def _normalized(row):
+    date, sender, amount, doctor = (list(row) + [""] * 4)[:4]
+    try:
+        amount = parse_cents(amount)
+    except ValueError:
+        amount = str(amount).strip()
+    return [str(date).strip(), str(sender).strip(), amount, str(doctor).strip()]
+
+def diff_payments(found_payments, archived_ids, sheet_rows, doctors):
+    """
+    Compares re-parsed payments with the Payments tab. Rows are matched by
+    message ID, or by fingerprint for rows written before that column existed.
+    Returns (change, sheet_row_number, message_id, old_row, new_row) tuples:
+    '~' the sheet row differs, '+' the email isn't in the sheet, '-' the
+    sheet row's email no longer parses.
+    """
+    by_key = {}
+    for row_number, row in enumerate(sheet_rows, start=2):
+        for key in row_keys(row):
+            by_key.setdefault(key, (row_number, row))
+
+    changes = []
+    for p in found_payments:
+        new_row = [p['date'], p['sender'], sheet_text(p['amount']), doctors.match(p['sender'])]
+        match = by_key.get(p['message_id']) or by_key.get(payment_fingerprint(p['date'], p['amount'], p['sender']))
+        if not match:
+            changes.append(('+', None, p['message_id'], None, new_row))
+        elif _normalized(match[1]) != _normalized(new_row):
+            changes.append(('~', match[0], p['message_id'], match[1][:4], new_row))
+
+    parsed_ids = {p['message_id'] for p in found_payments}
+    for row_number, row in enumerate(sheet_rows, start=2):
+        msg_id = row[4].strip() if len(row) > 4 else ""
+        if msg_id in archived_ids and msg_id not in parsed_ids:
+            changes.append(('-', row_number, msg_id, row[:4], None))
+    return changes
+
+def run_reparse(sh, diff_out=None):
+    """
+    Re-runs the current parser over the local mail archive and reports how
+    the result differs from the Payments tab. Read-only: nothing is written
+    to the sheet, and Gmail isn't contacted.
+    """
+    archive = open_mail_archive()
+    print(f"🗄️ Re-parsing {len(archive)} archived emails...")
+
+    found_payments = []
+    archived_ids = set()
+    with ProcessPoolExecutor(max_workers=PARSE_WORKERS, mp_context=multiprocessing.get_context('spawn')) as pool:
+        for msgs in archive.messages():
+            metrics.count('messages_seen', len(msgs))
+            archived_ids.update(m['id'] for m in msgs)
+            with metrics.span('parse'):
+                found_payments += parse_in_pool(pool, msgs)
+    metrics.count('parsed', len(found_payments))
+    metrics.count('unparsed', len(archived_ids) - len(found_payments))
+
+    with metrics.span('dedup_read'):
+        sheet_rows = sh.worksheet(WORKSHEET_NAME).get_all_values()[1:]
+    with metrics.span('rules_read'):
+        doctors = load_doctor_rules(sh)
+
+    changes = diff_payments(found_payments, archived_ids, sheet_rows, doctors)
+
+    for change, row_number, msg_id, old, new in changes:
+        where = f"row {row_number}" if row_number else "new"
+        if change == '~':
+            print(f"~ {where} {msg_id}: {' | '.join(old)}  ->  {' | '.join(new)}")
+        elif change == '+':
+            print(f"+ {where} {msg_id}: {' | '.join(new)}")
+        else:
+            print(f"- {where} {msg_id}: {' | '.join(old)} (no longer parses)")
+
+    if diff_out:
+        with open(diff_out, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['Change', 'Row', 'Message ID', 'Old Date', 'Old Sender', 'Old Amount', 'Old Doctor',
+                             'Date', 'Sender', 'Amount', 'Doctor'])
+            for change, row_number, msg_id, old, new in changes:
+                writer.writerow([change, row_number or "", msg_id] + list(old or [""] * 4) + list(new or [""] * 4))
+        print(f"💾 Wrote diff to {diff_out}")
+
+    counts = {c: sum(1 for ch in changes if ch[0] == c) for c in '~+-'}
+    print(f"✅ Re-parse done: {counts['~']} changed, {counts['+']} missing from sheet, "
+          f"{counts['-']} no longer parse.")
+    return changes
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Sync Interac e-Transfer emails into the Payments sheet.")
+    parser.add_argument('--backfill', action='store_true',
+                        help="Page through the whole matching history instead of just new emails.")
+    parser.add_argument('--since', type=lambda v: datetime.strptime(v, '%Y-%m-%d'),
+                        help="With --backfill: only emails after this date (YYYY-MM-DD).")
+    parser.add_argument('--watch', action='store_true',
+                        help="Keep running and sync as soon as the mailbox changes.")
+    parser.add_argument('--max-runtime', type=int,
+                        help="With --watch: stop after this many seconds.")
+    parser.add_argument('--rebuild-index', action='store_true',
+                        help="Rebuild the local dedup index from the Payments tab.")
+    parser.add_argument('--reparse', action='store_true',
+                        help="Re-parse the local mail archive and diff it against the Payments tab (read-only).")
+    parser.add_argument('--diff-out',
+                        help="With --reparse: also write the differences to this CSV file.")
+    args = parser.parse_args()
+    if args.backfill and not args.since:
+        parser.error("--backfill requires --since YYYY-MM-DD")
+    if sum([args.backfill, args.watch, args.reparse]) > 1:
+        parser.error("--backfill, --watch and --reparse can't be combined")
+    return args
+
+def reparse(args):
+    print("🤖 Re-parsing archived payment emails...")
+    with metrics.span('startup'):
+        sh = get_google_spreadsheet()
+    if not sh:
+        print("❌ Sheets Auth Failed. Exiting.")
+        exit(1)
+    try:
+        run_reparse(sh, args.diff_out)
+    except Exception as e:
+        print(f"❌ Fatal Error: {e}")
+        exit(1)
+
+def sync(args):
     print("🤖 Starting Payment Sync Robot...")
     
-    # 1. Auth Gmail
-    service = get_gmail_service()
+    # 1 + 2. Auth Gmail and Sheets in parallel: the OAuth token refresh and
+    # the spreadsheet open are independent round-trips
+    def auth_gmail():
+        creds = None if replay_dir() else get_gmail_credentials()
+        return creds, get_gmail_service(creds)
+
+    with metrics.span('startup'):
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            gmail_auth = pool.submit(auth_gmail)
+            sh = get_google_spreadsheet()
+            creds, service = gmail_auth.result()
+
     if not service:
         print("❌ Gmail Auth Failed. Exiting.")
         # We don't exit(1) to avoid failing the workflow if it's just a credential issue? 
         # Actually we should fail so user knows.
         exit(1)
 
-    # 2. Search
-    query = 'subject:"Interac e-Transfer" "deposited"'
-    print(f"🔍 Searching: {query}")
-    
-    try:
-        results = service.users().messages().list(userId='me', q=query, maxResults=20).execute()
-        messages = results.get('messages', [])
-        print(f"📧 Found {len(messages)} emails.")
-        
-        found_payments = []
-        for msg in messages:
-            p = parse_interac_email(service, msg['id'])
-            if p:
-                found_payments.append(p)
+    if not sh:
+        print("❌ Sheets Auth Failed. Exiting.")
+        exit(1)
 
-        # 3. Auth Sheets
-        ws = get_google_sheet_worksheet()
-        if not ws:
-            print("❌ Sheets Auth Failed. Exiting.")
-            exit(1)
-
-        existing_data = ws.get_all_values()
-        existing_keys = set()
-        
-        # Deduplication Map
-        for row in existing_data[1:]:
-            if len(row) > 2:
-                # Key: Amount_Sender (Rough)
-                amt = str(row[2]).replace('$','').replace(',','')
-                snd = str(row[1]).lower().strip()
-                key = f"{amt}_{snd}"
-                existing_keys.add(key)
-
-        new_rows = []
-        for p in found_payments:
-            p_amt = str(p['amount']).replace(',','')
-            p_snd = str(p['sender']).lower().strip()
-            key = f"{p_amt}_{p_snd}"
-            
-            if key not in existing_keys:
-                # Logic for Doctor
-                doctor = "Unknown"
-                if "TRIPIC" in p['sender'].upper(): doctor = "Dr. Tripic"
-                elif "CARTAGENA" in p['sender'].upper(): doctor = "Dr. Cartagena"
-                
-                new_rows.append([p['date'], p['sender'], p['amount'], doctor])
-                existing_keys.add(key) # Prevent internal dupes
-                print(f"✨ NEW ENTRY: {p['sender']} - ${p['amount']}")
-            else:
-                # print(f"Skipping duplicate: {p['sender']}")
-                pass
+    try:
+        with metrics.span('startup'):
+            state_ws = open_state_worksheet(sh)
+            state = load_state(state_ws)
+        print(f"🚀 Startup took {metrics.spans['startup']:.2f}s")
 
-        if new_rows:
-            ws.append_rows(new_rows)
-            print(f"✅ Automatically added {len(new_rows)} payments to Sheet.")
+        if args.backfill:
+            run_backfill(service, creds, sh, state_ws, state, args.since, args.rebuild_index)
+        elif args.watch:
+            run_incremental(service, sh, state_ws, state, args.rebuild_index)
+            run_watch(service, sh, state_ws, state, args.max_runtime)
         else:
-            print("✅ No new payments found.")
+            run_incremental(service, sh, state_ws, state, args.rebuild_index)
 
     except Exception as e:
         print(f"❌ Fatal Error: {e}")
         exit(1)
 
+def main():
+    args = parse_args()
+    metrics.mode = ('backfill' if args.backfill else 'watch' if args.watch
+                    else 'reparse' if args.reparse else 'incremental')
+    status = 'failed'
+    try:
+        if args.reparse:
+            reparse(args)
+        else:
+            sync(args)
+        status = 'ok'
+    finally:
+        for line in usage_summary():
+            print(f"📊 {line}")
+        rec = metrics.finish(status, quota.snapshot(), quota.first_call_at)
+        print("⏱️ " + ", ".join(f"{stage} {secs:.2f}s" for stage, secs in rec['spans_s'].items()))
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,35 @@
+"""Persisted state for the payment sync robot.
+
+GitHub Actions runners are thrown away after every run, so the robot keeps its
+cursors in a tiny key/value tab ("Sync_State") inside the same spreadsheet as
+the Payments tab. Column A is the key, column B the value.
+"""
+import gspread
+
+STATE_WORKSHEET = "Sync_State"
+STATE_HEADERS = ["Key", "Value"]
+
+
+def open_state_worksheet(sh):
+    """Returns the Sync_State tab, creating it on first use."""
+    try:
+        return sh.worksheet(STATE_WORKSHEET)
+    except gspread.exceptions.WorksheetNotFound:
+        ws = sh.add_worksheet(title=STATE_WORKSHEET, rows=20, cols=2)
+        ws.update(range_name="A1", values=[STATE_HEADERS])
+        return ws
+
+
+def load_state(ws):
+    """Reads the whole state tab into a plain dict of strings."""
+    state = {}
+    for row in ws.get_all_values()[1:]:
+        if row and row[0]:
+            state[row[0]] = row[1] if len(row) > 1 else ""
+    return state
+
+
+def save_state(ws, state):
+    """Writes the state dict back in one update call."""
+    rows = [STATE_HEADERS] + [[k, str(v)] for k, v in sorted(state.items())]
+    ws.update(range_name="A1", values=rows)
@@ -0,0 +1 @@
+"""Shared code for the EMG dashboards (pages/) and the payment sync robot (automation/)."""
@@ -0,0 +1,368 @@
+"""
+Data access for the dashboards (pages/).
+
+Pages read from the local mirror (emg/mirror.py), never from Sheets directly:
+  - get_client(): one gspread client per process (st.cache_resource); its
+    token is reused across sessions and refreshed ahead of expiry
+  - get_pool(): the Spreadsheet / Worksheet handles opened so far, keyed by
+    spreadsheet ID, so a sheet is opened (and its name searched in Drive)
+    once per process rather than once per rerun
+  - get_refresher(): the background thread that keeps MIRRORED_TABS in the
+    mirror up to date, one values:batchGet per spreadsheet
+  - get_values(sheet, worksheet): one tab's cell values, from the mirror
+    (synced on the spot only the first time a tab is ever read)
+
+and the typed loaders build DataFrames from those values, with columns
+converted per the tab's schema (emg/schema.py: money in int64 cents, dates
+in a datetime64 'Date Object' column, repeated labels as categories):
+    df = load_payments()
+    df = load_expenses()
+    df = load_work_log()
+    df = load_london()
+    df_pay, df_work = load_kitchener(PAYMENTS_WORKSHEET, WORK_LOG_WORKSHEET)
+
+The last DataFrame built for each tab is kept in memory and served (as a
+copy) until the mirror holds different rows for it, so reruns don't even
+touch the disk, and nobody waits while the refresher syncs in the
+background. show_freshness(...) tells the user how old each dataset is,
+and warns if a tab's header row has drifted from its schema or some of
+its dates couldn't be read.
+
+After writing to a tab, call refresh(dataset) (e.g. refresh(EXPENSES)) so
+the mirror picks the change up now; refresh() with no arguments re-syncs
+every tab. Refreshes run in the background and are waited on for at most
+REFRESH_WAIT seconds.
+
+Spreadsheet IDs can be given in secrets to skip the Drive name search:
+    [sheet_keys]
+    "EMG Payments Kitchener" = "1AbC..."
+"""
+import json
+import threading
+import time
+
+import gspread
+import pandas as pd
+import streamlit as st
+
+from emg import schema
+from emg.google_api import sheets_client_from_dict
+from emg.mirror import Refresher, open_mirror
+from emg.money import money  # pages show cent amounts with data.money()
+
+KITCHENER_SHEET = "EMG Payments Kitchener"
+LONDON_SHEET = "Tugolov combined questionnaire(Responses)"
+
+PAYMENTS_WORKSHEET = "Payments"
+EXPENSES_WORKSHEET = "Expenses"
+# Older sheets keep their expenses in a tab by this name instead
+LEGACY_EXPENSES_WORKSHEET = "Expenses_Form"
+WORK_LOG_WORKSHEET = "Work_Log"
+LONDON_WORKSHEET = "Form responses 1"
+
+# Datasets: (spreadsheet, tab)
+PAYMENTS = (KITCHENER_SHEET, PAYMENTS_WORKSHEET)
+EXPENSES = (KITCHENER_SHEET, EXPENSES_WORKSHEET)
+WORK_LOG = (KITCHENER_SHEET, WORK_LOG_WORKSHEET)
+LONDON = (LONDON_SHEET, LONDON_WORKSHEET)
+LABELS = {PAYMENTS: "Payments", EXPENSES: "Expenses", WORK_LOG: "Work Log", LONDON: "London responses"}
+
+MIRRORED_TABS = {
+    KITCHENER_SHEET: [PAYMENTS_WORKSHEET, EXPENSES_WORKSHEET, WORK_LOG_WORKSHEET],
+    LONDON_SHEET: [LONDON_WORKSHEET],
+}
+
+# How long a refresh button waits for fresh data before showing what's there
+REFRESH_WAIT = 5  # seconds
+# A full refresh this soon after the last one (e.g. several people pressing
+# refresh at once) is served from the mirror as is
+REFRESH_DEBOUNCE = 10  # seconds
+
+EXPENSE_COLUMNS = ["Date", "Category", "Amount", "Location", "Description", "Receipt"]
+
+
+@st.cache_resource
+def get_client():
+    if "gcpjson" not in st.secrets:
+        st.error("Secrets 'gcpjson' not found.")
+        st.stop()
+    try:
+        return sheets_client_from_dict(json.loads(st.secrets["gcpjson"]))
+    except Exception as e:
+        st.error(f"❌ Error: {e}")
+        st.stop()
+
+
+class HandlePool:
+    """Opened spreadsheets by ID, their names' IDs, and opened worksheets."""
+
+    def __init__(self, gc, sheet_keys=None):
+        self.gc = gc
+        self.lock = threading.Lock()
+        self.keys = dict(sheet_keys or {})  # spreadsheet name -> ID
+        self.spreadsheets = {}              # ID -> gspread.Spreadsheet
+        self.worksheets = {}                # (ID, tab name) -> gspread.Worksheet
+
+    def spreadsheet(self, sheet_name):
+        with self.lock:
+            key = self.keys.get(sheet_name)
+            if key in self.spreadsheets:
+                return self.spreadsheets[key]
+            sh = self.gc.open_by_key(key) if key else self.gc.open(sheet_name)
+            self.keys[sheet_name] = sh.id
+            self.spreadsheets[sh.id] = sh
+            return sh
+
+    def worksheet(self, sheet_name, worksheet_name):
+        sh = self.spreadsheet(sheet_name)
+        with self.lock:
+            if (sh.id, worksheet_name) not in self.worksheets:
+                self.worksheets[(sh.id, worksheet_name)] = sh.worksheet(worksheet_name)
+            return self.worksheets[(sh.id, worksheet_name)]
+
+    def discard(self, sheet_name, worksheet_name):
+        """Forgets a handle that stopped working (e.g. the tab was renamed)."""
+        with self.lock:
+            self.worksheets.pop((self.keys.get(sheet_name), worksheet_name), None)
+
+
+@st.cache_resource
+def get_pool():
+    return HandlePool(get_client(), st.secrets.get("sheet_keys", {}))
+
+
+def get_worksheet(sheet_name, worksheet_name):
+    """Pooled handle, for writes; reads go through the mirror."""
+    return get_pool().worksheet(sheet_name, worksheet_name)
+
+
+def append_row(sheet_name, worksheet_name, row):
+    """
+    Appends one row through the pooled handle. If that fails, the handle is
+    dropped (the tab may have been renamed or deleted), so the next write
+    opens the tab again instead of failing until the process restarts.
+    """
+    pool = get_pool()
+    try:
+        return pool.worksheet(sheet_name, worksheet_name).append_row(row)
+    except gspread.exceptions.GSpreadException:
+        pool.discard(sheet_name, worksheet_name)
+        raise
+
+
+@st.cache_resource
+def get_refresher():
+    return Refresher(get_pool(), open_mirror(), MIRRORED_TABS).start()
+
+
+def get_values(sheet_name, worksheet_name):
+    """All cell values of one tab (header row included), from the mirror."""
+    refresher = get_refresher()
+    values = refresher.mirror.read(sheet_name, worksheet_name)
+    if values is None:
+        # Never mirrored (fresh disk): sync the whole spreadsheet once, now,
+        # with this tab if it isn't one of the mirrored ones
+        tabs = MIRRORED_TABS.get(sheet_name, [])
+        refresher.refresh(sheet_name, tabs if worksheet_name in tabs else tabs + [worksheet_name])
+        values = refresher.mirror.read(sheet_name, worksheet_name)
+    if values is None:
+        raise gspread.exceptions.WorksheetNotFound(worksheet_name)
+    return values
+
+
+def refresh(*datasets, full=False, wait=REFRESH_WAIT):
+    """
+    Syncs the given datasets (e.g. refresh(PAYMENTS, EXPENSES)), or every
+    mirrored tab if none are given, in the background (one batchGet per
+    spreadsheet) and waits up to `wait` seconds for it. Only new rows are
+    downloaded unless `full` (for the refresh buttons, when someone suspects
+    the mirror missed an edit); full refreshes are debounced by
+    REFRESH_DEBOUNCE. Concurrent refreshes of a tab, from any session, share
+    one fetch. True if the refresh finished in time.
+    """
+    refresher = get_refresher()
+    by_sheet = {}
+    for sheet_name, worksheet_name in datasets or [(s, w) for s, tabs in MIRRORED_TABS.items() for w in tabs]:
+        by_sheet.setdefault(sheet_name, []).append(worksheet_name)
+    min_age = REFRESH_DEBOUNCE if full else 0
+    threads = [refresher.refresh_in_background(sheet_name, tabs, full=full, min_age=min_age)
+               for sheet_name, tabs in by_sheet.items()]
+    deadline = time.monotonic() + wait
+    for thread in threads:
+        thread.join(max(0, deadline - time.monotonic()))
+    return not any(thread.is_alive() for thread in threads)
+
+
+def _age(seconds):
+    if seconds < 90:
+        return f"{int(seconds)}s"
+    if seconds < 90 * 60:
+        return f"{int(seconds // 60)} min"
+    return f"{seconds / 3600:.1f} h"
+
+
+def freshness(sheet_name, worksheet_name):
+    """One line on how current a tab's data is, e.g. 'Payments: synced 12s ago'."""
+    refresher = get_refresher()
+    synced_at = refresher.mirror.synced_at(sheet_name, worksheet_name)
+    label = LABELS.get((sheet_name, worksheet_name), worksheet_name)
+    line = f"{label}: " + (f"synced {_age(time.time() - synced_at)} ago" if synced_at else "not synced yet")
+    if refresher.is_refreshing(sheet_name, worksheet_name):
+        line += " · 🔄 refreshing"
+    elif sheet_name in refresher.errors:
+        failed_at, message = refresher.errors[sheet_name]
+        line += f" · ⚠️ last refresh failed {_age(time.time() - failed_at)} ago ({message})"
+    return line
+
+
+def show_freshness(*datasets):
+    """
+    Caption with the freshness of each dataset the page shows, and a warning
+    if a tab's headers drifted from its schema or some of its dates can't be read.
+    """
+    st.caption("📡 " + " | ".join(freshness(sheet_name, worksheet_name) for sheet_name, worksheet_name in datasets))
+    for dataset in datasets:
+        problems = _problems.get(dataset)
+        if problems:
+            st.warning(f"⚠️ {LABELS.get(dataset, dataset[1])}: " + "; ".join(problems))
+
+
+_frames = {}  # (sheet, tab, builder) -> (mirror version, DataFrame)
+_problems = {}  # (sheet, tab) -> what was off when its frame was last built
+_frames_lock = threading.Lock()
+
+
+def _version(info):
+    return (info['n_rows'], info['checksum'], info['full_synced_at']) if info else None
+
+
+def _frame_problems(df):
+    """Header drift and unreadable dates found while typing a tab (see emg/schema.py)."""
+    problems = list(df.attrs.get('drift', []))
+    n_bad_dates = df.attrs.get('unreadable_dates', 0)
+    if n_bad_dates:
+        problems.append(f"{n_bad_dates} rows have no readable date and are left out")
+    return problems
+
+
+def _load(sheet_name, worksheet_name, build):
+    """build(values) for a tab, rebuilt only when the mirrored rows change."""
+    mirror = get_refresher().mirror
+    key = (sheet_name, worksheet_name, build.__name__)
+    # Version first, values second: if a refresh lands in between, the frame
+    # is just rebuilt once more next time, never labelled newer than it is
+    version = _version(mirror.tab_info(sheet_name, worksheet_name))
+    with _frames_lock:
+        cached = _frames.get(key)
+    if version is None or cached is None or cached[0] != version:
+        values = get_values(sheet_name, worksheet_name)
+        if version is None:
+            # get_values just did the first sync
+            version = _version(mirror.tab_info(sheet_name, worksheet_name))
+        cached = (version, build(values))
+        with _frames_lock:
+            _frames[key] = cached
+            _problems[(sheet_name, worksheet_name)] = _frame_problems(cached[1])
+    # Pages add columns to what they get; keep the cached frame pristine
+    return cached[1].copy()
+
+
+def typed_df(values, tab_schema):
+    """
+    First row as (stripped) headers, columns converted per the tab's schema
+    (emg/schema.py). Later duplicates of a header are dropped; they and any
+    other header drift, and amounts that couldn't be read, are listed in
+    df.attrs['drift'].
+    """
+    if not values:
+        return pd.DataFrame()
+    df = pd.DataFrame(values[1:], columns=[h.strip() for h in values[0]])
+    # Arrow (st.dataframe) can't handle duplicate column names
+    df = schema.apply(df.loc[:, ~df.columns.duplicated()].copy(), tab_schema)
+    df.attrs['drift'] = schema.drift(values[0], tab_schema) + df.attrs.get('drift', [])
+    return df
+
+
+# --- TYPED LOADERS ---
+
+def payments_df(values):
+    return typed_df(values, schema.PAYMENTS)
+
+
+def load_payments():
+    """Kitchener Payments tab: Amount in int64 cents, Date parsed into 'Date Object'."""
+    return _load(KITCHENER_SHEET, PAYMENTS_WORKSHEET, payments_df)
+
+
+def work_log_df(values):
+    return typed_df(values, schema.WORK_LOG)
+
+
+def load_work_log():
+    """Kitchener Work_Log tab, 'Date Worked' parsed into 'Date Object'."""
+    return _load(KITCHENER_SHEET, WORK_LOG_WORKSHEET, work_log_df)
+
+
+def london_df(values):
+    return typed_df(values, schema.LONDON)
+
+
+def load_london():
+    """London questionnaire responses, Timestamp parsed into 'Date Object' (and Amount in cents if the tab has one)."""
+    return _load(LONDON_SHEET, LONDON_WORKSHEET, london_df)
+
+
+def _expense_row(row):
+    row = list(row) + [""] * (8 - len(row))
+
+    # Current layout (written by the Expense Tracker):
+    # Timestamp, Date, Category, Amount, Location, Description (Receipt note)
+    date_val, cat_val, amt_val, loc_val, desc_val, receipt_val = row[1], row[2], row[3], row[4], row[2], row[5]
+
+    # Old layout: Date, Category, Amount, Description, ?, Location
+    is_old_data = False
+    try:
+        float(str(row[2]).replace('$', '').replace(',', ''))
+        if len(str(row[1])) > 0 and not str(row[1])[0].isdigit():
+            is_old_data = True
+    except ValueError:
+        pass
+    if is_old_data:
+        date_val, cat_val, amt_val, desc_val, loc_val, receipt_val = row[0], row[1], row[2], row[3], row[5], ""
+
+    return [date_val, cat_val, amt_val, loc_val, desc_val, receipt_val]
+
+
+def expenses_df(values):
+    df = pd.DataFrame([_expense_row(r) for r in values[1:]], columns=EXPENSE_COLUMNS)
+    df = schema.apply(df, schema.EXPENSES)
+    df.attrs['drift'] = (schema.drift(values[0], schema.EXPENSES) if values else []) + df.attrs.get('drift', [])
+    return df
+
+
+def load_expenses():
+    """
+    Expenses tab in one shape, whichever layout each row was written in.
+    Amount in int64 cents. Sheets without an Expenses tab are read from
+    LEGACY_EXPENSES_WORKSHEET.
+    """
+    mirror = get_refresher().mirror
+    if (mirror.tab_info(KITCHENER_SHEET, EXPENSES_WORKSHEET) is None
+            and mirror.tab_info(KITCHENER_SHEET, LEGACY_EXPENSES_WORKSHEET) is not None):
+        return _load(KITCHENER_SHEET, LEGACY_EXPENSES_WORKSHEET, expenses_df)
+    try:
+        return _load(KITCHENER_SHEET, EXPENSES_WORKSHEET, expenses_df)
+    except gspread.exceptions.WorksheetNotFound:
+        return _load(KITCHENER_SHEET, LEGACY_EXPENSES_WORKSHEET, expenses_df)
+
+
+KITCHENER_BUILDERS = {
+    PAYMENTS_WORKSHEET: payments_df,
+    EXPENSES_WORKSHEET: expenses_df,
+    WORK_LOG_WORKSHEET: work_log_df,
+}
+
+
+def load_kitchener(*worksheet_names):
+    """DataFrames for several Kitchener tabs (same shapes as the single-tab loaders)."""
+    return [_load(KITCHENER_SHEET, name, KITCHENER_BUILDERS[name]) for name in worksheet_names]
@@ -0,0 +1,68 @@
+"""
+Date parsing for the typed loaders (emg/schema.py).
+
+The tabs' dates come in a handful of known shapes:
+  - 25/12/2025 14:05:00   Payments, written by sync_robot.py
+  - 25/12/2025 9:05:00    London, Google Forms timestamps
+  - 2025-12-25            Expenses (str(date) from the Expense Tracker), Work_Log
+
+Left to guess, pd.to_datetime either infers one format from the first value
+and turns every row written differently into NaT, or (format='mixed')
+guesses value by value, which is very slow. parse() instead reads the
+column in one vectorized pass per known format, each pass over the rows no
+earlier format could read, and only hands what no known format reads to
+pandas' guessing. The formats that matched a column are remembered (per
+worksheet column) and tried first next time.
+"""
+import threading
+
+import pandas as pd
+
+DAYFIRST_FORMATS = [
+    "%d/%m/%Y %H:%M:%S",
+    "%Y-%m-%d",
+    "%Y-%m-%d %H:%M:%S",
+    "%d/%m/%Y",
+    "%d/%m/%Y %H:%M",
+    "%Y-%m-%dT%H:%M:%S",
+]
+MONTHFIRST_FORMATS = [f.replace("%d/%m/", "%m/%d/") for f in DAYFIRST_FORMATS]
+
+_formats = {}  # column key -> formats that matched it last time, most rows first
+_formats_lock = threading.Lock()
+
+
+def parse(series, dayfirst=True, key=None):
+    """
+    Text dates -> (datetime64 Series, number of rows left NaT). Blank and
+    unreadable cells become NaT. `key` names the column (e.g. (tab, column))
+    for remembering its formats.
+    """
+    text = series.astype(str).str.strip()
+    todo = text[(text != "") & series.notna()]
+    with _formats_lock:
+        known = list(_formats.get(key, []))
+    candidates = known + [f for f in (DAYFIRST_FORMATS if dayfirst else MONTHFIRST_FORMATS) if f not in known]
+
+    parts, matched = [], {}
+    for fmt in candidates:
+        if todo.empty:
+            break
+        parsed = pd.to_datetime(todo, format=fmt, errors='coerce')
+        ok = parsed.notna()
+        if ok.any():
+            parts.append(parsed[ok])
+            matched[fmt] = int(ok.sum())
+            todo = todo[~ok]
+    if not todo.empty:
+        # Shapes none of the formats know: let pandas guess, value by value
+        parts.append(pd.to_datetime(todo, format='mixed', dayfirst=dayfirst, errors='coerce'))
+
+    if key is not None and matched:
+        with _formats_lock:
+            _formats[key] = sorted(matched, key=matched.get, reverse=True)
+    if parts:
+        result = pd.concat(parts).reindex(series.index)
+    else:
+        result = pd.Series(pd.NaT, index=series.index, dtype='datetime64[us]')
+    return result, int(result.isna().sum())
@@ -0,0 +1,549 @@
+"""
+In-memory stand-ins for the Gmail API and gspread, backed by fixture files.
+
+Fixture directory layout (see emg/fixtures/replay for a small sample):
+
+    gmail/<message id>.json      Gmail message resources (format=full), or
+    gmail/<name>.eml             raw emails, converted on load
+    sheets/<spreadsheet>.json    {"id": "...", "title": "...",
+                                  "worksheets": {"Payments": [[header...], [row...], ...]}}
+
+Only the surface our code touches is implemented: users().messages().list/get,
+users().history().list, users().getProfile, batch requests, and the gspread
+Client / Spreadsheet / Worksheet methods used by the robot and the pages.
+Writes stay in memory; fixture files are never modified.
+
+`scale` replicates every message and every data row that many times (with
+fresh message IDs and dates shifted back a day per copy) for load testing.
+`latency` adds a fixed delay per call to mimic the network.
+"""
+import base64
+import json
+import os
+import re
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from email import message_from_bytes, policy
+from email.utils import parsedate_to_datetime
+
+import gspread
+import httplib2
+import requests
+from googleapiclient.errors import HttpError
+
+DAY_MS = 24 * 60 * 60 * 1000
+
+_AFTER_RE = re.compile(r'after:(\S+)')
+_A1_CELL_RE = re.compile(r'^([A-Z]*)(\d*)$')
+
+
+def _not_found(what):
+    return HttpError(httplib2.Response({'status': 404}), f"{what} not found".encode())
+
+
+def _bad_range(a1):
+    """What Sheets answers for a range on a tab that doesn't exist."""
+    resp = requests.Response()
+    resp.status_code = 400
+    resp._content = json.dumps({'error': {
+        'code': 400, 'message': f"Unable to parse range: {a1}", 'status': 'INVALID_ARGUMENT'}}).encode()
+    return gspread.exceptions.APIError(resp)
+
+
+# --- GMAIL ---
+def eml_to_gmail_message(raw, msg_id):
+    """Converts a raw .eml into the shape of a Gmail API message resource."""
+    em = message_from_bytes(raw, policy=policy.default)
+
+    def to_part(part):
+        node = {
+            'mimeType': part.get_content_type(),
+            'headers': [{'name': k, 'value': str(v)} for k, v in part.items()],
+            'body': {},
+        }
+        if part.is_multipart():
+            node['parts'] = [to_part(p) for p in part.iter_parts()]
+        else:
+            data = part.get_content().encode('utf-8')
+            node['body'] = {'size': len(data), 'data': base64.urlsafe_b64encode(data).decode('ascii')}
+        return node
+
+    payload = to_part(em)
+    internal_ms = int(parsedate_to_datetime(em['Date']).timestamp() * 1000)
+    return {
+        'id': msg_id,
+        'threadId': msg_id,
+        'labelIds': ['INBOX'],
+        'snippet': '',
+        'internalDate': str(internal_ms),
+        'payload': payload,
+    }
+
+
+class FakeMailbox:
+    """Message store plus a history log; history ID n is the nth message added."""
+
+    def __init__(self, messages, latency=0.0):
+        self.latency = latency
+        self.calls = Counter()
+        self.lock = threading.Lock()
+        self.by_id = {}
+        self.history = []
+        for msg in sorted(messages, key=lambda m: int(m['internalDate'])):
+            self.add_message(msg)
+
+    @property
+    def history_id(self):
+        return len(self.history)
+
+    def add_message(self, msg):
+        """Delivers a message (also how tests simulate new mail arriving)."""
+        with self.lock:
+            self.by_id[msg['id']] = msg
+            self.history.append(msg['id'])
+
+    def call(self, name, fn):
+        self.calls[name] += 1
+        if self.latency:
+            time.sleep(self.latency)
+        return fn()
+
+
+class _FakeRequest:
+    def __init__(self, mailbox, name, fn):
+        self.mailbox = mailbox
+        self.name = name
+        self.fn = fn
+
+    def execute(self, http=None, num_retries=0):
+        return self.mailbox.call(self.name, self.fn)
+
+
+class _FakeBatch:
+    def __init__(self, mailbox, callback):
+        self.mailbox = mailbox
+        self.callback = callback
+        self.requests = []
+
+    def add(self, request, callback=None, request_id=None):
+        self.requests.append((request_id or str(len(self.requests)), request, callback or self.callback))
+
+    def execute(self, http=None):
+        # One round-trip for the whole batch
+        self.mailbox.call('batch', lambda: None)
+        for request_id, request, callback in self.requests:
+            try:
+                response, exception = request.fn(), None
+            except Exception as e:
+                response, exception = None, e
+            self.mailbox.calls[request.name] += 1
+            callback(request_id, response, exception)
+
+
+def _after_ms(query):
+    m = _AFTER_RE.search(query or "")
+    if not m:
+        return None
+    value = m.group(1)
+    if value.isdigit():
+        return int(value) * 1000
+    return int(datetime.strptime(value, '%Y/%m/%d').timestamp() * 1000)
+
+
+class _FakeMessages:
+    def __init__(self, mailbox):
+        self.mailbox = mailbox
+
+    def list(self, userId='me', q=None, maxResults=100, pageToken=None, **kwargs):
+        def run():
+            after = _after_ms(q)
+            ids = [m for m in self.mailbox.history
+                   if after is None or int(self.mailbox.by_id[m]['internalDate']) > after]
+            ids.sort(key=lambda m: int(self.mailbox.by_id[m]['internalDate']), reverse=True)
+            start = int(pageToken or 0)
+            page = ids[start:start + maxResults]
+            resp = {'messages': [{'id': m, 'threadId': m} for m in page], 'resultSizeEstimate': len(ids)}
+            if start + maxResults < len(ids):
+                resp['nextPageToken'] = str(start + maxResults)
+            if not page:
+                del resp['messages']
+            return resp
+        return _FakeRequest(self.mailbox, 'messages.list', run)
+
+    def get(self, userId='me', id=None, fields=None, format=None, **kwargs):
+        def run():
+            if id not in self.mailbox.by_id:
+                raise _not_found(f"Message {id}")
+            return self.mailbox.by_id[id]
+        return _FakeRequest(self.mailbox, 'messages.get', run)
+
+
+class _FakeHistory:
+    def __init__(self, mailbox):
+        self.mailbox = mailbox
+
+    def list(self, userId='me', startHistoryId=None, historyTypes=None, pageToken=None, **kwargs):
+        def run():
+            start = int(startHistoryId)
+            if start > self.mailbox.history_id:
+                raise _not_found(f"History {start}")
+            added = self.mailbox.history[start:]
+            return {
+                'history': [{'id': str(start + i + 1),
+                             'messagesAdded': [{'message': {'id': m, 'threadId': m,
+                                                            'labelIds': self.mailbox.by_id[m].get('labelIds', [])}}]}
+                            for i, m in enumerate(added)],
+                'historyId': str(self.mailbox.history_id),
+            }
+        return _FakeRequest(self.mailbox, 'history.list', run)
+
+
+class FakeGmailService:
+    def __init__(self, mailbox):
+        self.mailbox = mailbox
+
+    def users(self):
+        return self
+
+    def messages(self):
+        return _FakeMessages(self.mailbox)
+
+    def history(self):
+        return _FakeHistory(self.mailbox)
+
+    def getProfile(self, userId='me'):
+        return _FakeRequest(self.mailbox, 'getProfile', lambda: {
+            'historyId': str(self.mailbox.history_id),
+            'messagesTotal': len(self.mailbox.by_id),
+        })
+
+    def new_batch_http_request(self, callback=None):
+        return _FakeBatch(self.mailbox, callback)
+
+
+def load_messages(gmail_dir, scale=1):
+    base = []
+    for name in sorted(os.listdir(gmail_dir)) if os.path.isdir(gmail_dir) else []:
+        path = os.path.join(gmail_dir, name)
+        if name.endswith('.json'):
+            with open(path) as f:
+                base.append(json.load(f))
+        elif name.endswith('.eml'):
+            with open(path, 'rb') as f:
+                base.append(eml_to_gmail_message(f.read(), os.path.splitext(name)[0]))
+
+    messages = []
+    for k in range(scale):
+        for msg in base:
+            if k == 0:
+                messages.append(msg)
+                continue
+            clone = dict(msg)  # payload is shared; nothing mutates it
+            clone['id'] = f"{msg['id']}-{k}"
+            clone['threadId'] = clone['id']
+            clone['internalDate'] = str(int(msg['internalDate']) - k * DAY_MS)
+            messages.append(clone)
+    return messages
+
+
+# --- SHEETS ---
+def _col_to_index(letters):
+    n = 0
+    for ch in letters:
+        n = n * 26 + (ord(ch) - 64)
+    return n
+
+
+def _index_to_col(n):
+    letters = ""
+    while n:
+        n, rem = divmod(n - 1, 26)
+        letters = chr(65 + rem) + letters
+    return letters
+
+
+def _parse_a1(a1):
+    """'A2:C' -> (2, 1, None, 3); 1-based, None = open-ended."""
+    a1 = a1.split('!')[-1]
+    start, _, end = a1.partition(':')
+    m1 = _A1_CELL_RE.match(start)
+    m2 = _A1_CELL_RE.match(end or start)
+    r0 = int(m1.group(2)) if m1.group(2) else 1
+    c0 = _col_to_index(m1.group(1)) if m1.group(1) else 1
+    r1 = int(m2.group(2)) if m2.group(2) else None
+    c1 = _col_to_index(m2.group(1)) if m2.group(1) else None
+    return r0, c0, r1, c1
+
+
+def _trim(values):
+    """Drops trailing empty cells and rows, the way the Sheets API does."""
+    out = []
+    for row in values:
+        row = list(row)
+        while row and row[-1] == "":
+            row.pop()
+        out.append(row)
+    while out and not out[-1]:
+        out.pop()
+    return out
+
+
+def _fill_gaps(values):
+    """Pads rows to the same width, like gspread's get_all_values()."""
+    width = max((len(r) for r in values), default=0)
+    return [r + [""] * (width - len(r)) for r in values]
+
+
+def _numericise(value):
+    try:
+        return int(value)
+    except ValueError:
+        try:
+            return float(value)
+        except ValueError:
+            return value
+
+
+class FakeWorksheet:
+    def __init__(self, spreadsheet, title, rows, index):
+        self.spreadsheet = spreadsheet
+        self.title = title
+        self.rows = [list(r) for r in rows]
+        self.index = index
+        self.id = index
+
+    def _call(self, name, fn):
+        return self.spreadsheet.client.call(name, fn)
+
+    @property
+    def row_count(self):
+        return max(len(self.rows), 1000)
+
+    def _read(self, a1):
+        r0, c0, r1, c1 = _parse_a1(a1)
+        rows = self.rows[r0 - 1:r1]
+        return _trim([r[c0 - 1:c1] for r in rows])
+
+    def get_all_values(self):
+        return self._call('values.get', lambda: _fill_gaps(_trim(self.rows)))
+
+    def get_all_records(self):
+        def run():
+            values = _trim(self.rows)
+            if not values:
+                return []
+            header = values[0]
+            return [{h: _numericise(row[i]) if i < len(row) else "" for i, h in enumerate(header)}
+                    for row in values[1:]]
+        return self._call('values.get', run)
+
+    def row_values(self, row):
+        return self._call('values.get', lambda: (_trim([self.rows[row - 1]]) or [[]])[0] if row <= len(self.rows) else [])
+
+    def col_values(self, col):
+        return self._call('values.get', lambda: [v[0] if v else "" for v in self._read(f"{_index_to_col(col)}1:{_index_to_col(col)}")])
+
+    def get(self, range_name=None, **kwargs):
+        return self._call('values.get', lambda: self._read(range_name or "A1:ZZ"))
+
+    def batch_get(self, ranges, **kwargs):
+        return self._call('values.batchGet', lambda: [self._read(r) for r in ranges])
+
+    def update(self, values=None, range_name=None, **kwargs):
+        # Accept both gspread 5 (range, values) and 6 (values, range) positional orders
+        if isinstance(values, str):
+            values, range_name = range_name, values
+
+        def run():
+            r0, c0, _, _ = _parse_a1(range_name or "A1")
+            for i, row in enumerate(values):
+                target_row = r0 - 1 + i
+                while len(self.rows) <= target_row:
+                    self.rows.append([])
+                target = self.rows[target_row]
+                while len(target) < c0 - 1 + len(row):
+                    target.append("")
+                for j, v in enumerate(row):
+                    target[c0 - 1 + j] = str(v)
+            return {'updatedRange': f"{self.title}!{range_name}"}
+        return self._call('values.update', run)
+
+    def append_rows(self, values, **kwargs):
+        def run():
+            first = len(_trim(self.rows)) + 1
+            del self.rows[first - 1:]
+            self.rows.extend([str(v) for v in row] for row in values)
+            last = first + len(values) - 1
+            width = max((len(r) for r in values), default=1)
+            return {'updates': {'updatedRange': f"'{self.title}'!A{first}:{_index_to_col(width)}{last}",
+                                'updatedRows': len(values)}}
+        return self._call('values.append', run)
+
+    def append_row(self, values, **kwargs):
+        return self.append_rows([values], **kwargs)
+
+
+class FakeSpreadsheet:
+    def __init__(self, client, key, title, worksheets):
+        self.client = client
+        self.id = key
+        self.title = title
+        self._worksheets = [FakeWorksheet(self, name, rows, i) for i, (name, rows) in enumerate(worksheets.items())]
+
+    def worksheets(self):
+        return self.client.call('spreadsheets.get', lambda: list(self._worksheets))
+
+    def worksheet(self, title):
+        def run():
+            for ws in self._worksheets:
+                if ws.title == title:
+                    return ws
+            raise gspread.exceptions.WorksheetNotFound(title)
+        return self.client.call('spreadsheets.get', run)
+
+    def get_worksheet(self, index):
+        return self.client.call('spreadsheets.get', lambda: self._worksheets[index] if index < len(self._worksheets) else None)
+
+    def add_worksheet(self, title, rows=1000, cols=26, **kwargs):
+        def run():
+            ws = FakeWorksheet(self, title, [], len(self._worksheets))
+            self._worksheets.append(ws)
+            return ws
+        return self.client.call('spreadsheets.batchUpdate', run)
+
+    def values_batch_get(self, ranges, params=None, **kwargs):
+        def run():
+            value_ranges = []
+            titles = {w.title: w for w in self._worksheets}
+            for r in ranges:
+                if '!' not in r and r.strip("'") in titles:
+                    # A bare tab name is the whole tab
+                    values = _trim(titles[r.strip("'")].rows)
+                elif '!' not in r and r.startswith("'"):
+                    raise _bad_range(r)
+                else:
+                    title = r.split('!')[0].strip("'") if '!' in r else self._worksheets[0].title
+                    if title not in titles:
+                        raise _bad_range(r)
+                    values = titles[title]._read(r)
+                value_ranges.append({'range': r, 'majorDimension': 'ROWS', 'values': values})
+            return {'spreadsheetId': self.id, 'valueRanges': value_ranges}
+        return self.client.call('values.batchGet', run)
+
+
+class FakeSheetsClient:
+    """Stands in for gspread.Client; every call is counted in `calls`."""
+
+    def __init__(self, spreadsheets, latency=0.0):
+        self.latency = latency
+        self.calls = Counter()
+        self.by_key = {}
+        self.by_title = {}
+        for data in spreadsheets:
+            sh = FakeSpreadsheet(self, data['id'], data['title'], data['worksheets'])
+            self.by_key[sh.id] = sh
+            self.by_title[sh.title] = sh
+
+    def call(self, name, fn):
+        self.calls[name] += 1
+        if self.latency:
+            time.sleep(self.latency)
+        return fn()
+
+    def open(self, title, **kwargs):
+        def run():
+            if title not in self.by_title:
+                raise gspread.exceptions.SpreadsheetNotFound(title)
+            return self.by_title[title]
+        return self.call('drive.files.list', run)
+
+    def open_by_key(self, key):
+        def run():
+            if key not in self.by_key:
+                raise gspread.exceptions.SpreadsheetNotFound(key)
+            return self.by_key[key]
+        return self.call('spreadsheets.get', run)
+
+
+def load_spreadsheets(sheets_dir, scale=1):
+    spreadsheets = []
+    for name in sorted(os.listdir(sheets_dir)) if os.path.isdir(sheets_dir) else []:
+        if not name.endswith('.json'):
+            continue
+        with open(os.path.join(sheets_dir, name)) as f:
+            data = json.load(f)
+        data.setdefault('title', os.path.splitext(name)[0])
+        data.setdefault('id', data['title'])
+        if scale > 1:
+            data['worksheets'] = {title: rows[:1] + rows[1:] * scale if rows else rows
+                                  for title, rows in data['worksheets'].items()}
+        spreadsheets.append(data)
+    return spreadsheets
+
+
+# --- PROCESS-WIDE REPLAY INSTANCES ---
+# One fake per fixture dir, so writes made by one call are seen by the next
+# (e.g. the robot's appends, or a page re-reading after add_expense).
+_instances = {}
+_instances_lock = threading.Lock()
+
+
+def _settings():
+    return int(os.environ.get('EMG_REPLAY_SCALE', '1')), float(os.environ.get('EMG_REPLAY_LATENCY_MS', '0')) / 1000
+
+
+def fake_gmail_service(replay_dir):
+    scale, latency = _settings()
+    key = ('gmail', replay_dir, scale)
+    with _instances_lock:
+        if key not in _instances:
+            messages = load_messages(os.path.join(replay_dir, 'gmail'), scale)
+            _instances[key] = FakeGmailService(FakeMailbox(messages, latency))
+        return _instances[key]
+
+
+def fake_sheets_client(replay_dir):
+    scale, latency = _settings()
+    key = ('sheets', replay_dir, scale)
+    with _instances_lock:
+        if key not in _instances:
+            _instances[key] = FakeSheetsClient(load_spreadsheets(os.path.join(replay_dir, 'sheets'), scale), latency)
+        return _instances[key]
+
+
+# --- RECORD MODE ---
+def record_gmail(service, out_dir, query, limit=500):
+    """Saves real messages matching `query` as gmail/<id>.json fixtures."""
+    gmail_dir = os.path.join(out_dir, 'gmail')
+    os.makedirs(gmail_dir, exist_ok=True)
+    saved = 0
+    page_token = None
+    while saved < limit:
+        resp = service.users().messages().list(userId='me', q=query, maxResults=min(100, limit - saved),
+                                               pageToken=page_token).execute()
+        for m in resp.get('messages', []):
+            msg = service.users().messages().get(userId='me', id=m['id']).execute()
+            with open(os.path.join(gmail_dir, f"{m['id']}.json"), 'w') as f:
+                json.dump(msg, f)
+            saved += 1
+        page_token = resp.get('nextPageToken')
+        if not page_token:
+            break
+    return saved
+
+
+def record_spreadsheet(gc, title, out_dir):
+    """Saves every tab of a real spreadsheet as sheets/<title>.json."""
+    sheets_dir = os.path.join(out_dir, 'sheets')
+    os.makedirs(sheets_dir, exist_ok=True)
+    sh = gc.open(title)
+    data = {
+        'id': sh.id,
+        'title': sh.title,
+        'worksheets': {ws.title: ws.get_all_values() for ws in sh.worksheets()},
+    }
+    with open(os.path.join(sheets_dir, f"{title}.json"), 'w') as f:
+        json.dump(data, f, indent=1)
+    return {name: len(rows) for name, rows in data['worksheets'].items()}
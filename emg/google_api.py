@@ -0,0 +1,251 @@
+"""
+Rate-limited, retrying access to the Google APIs we use (Gmail, Sheets, Drive).
+
+Every call goes through call_with_retry(), which:
+  - waits on a per-API token bucket, so bursts (backfills, many dashboard
+    sessions) are smoothed out instead of tripping Google's per-user quotas
+  - retries 429 / 5xx / rate-limit 403s and dropped connections with
+    jittered exponential backoff, honouring Retry-After when Google sends it;
+    requests that aren't safe to repeat (values:append, spreadsheet
+    batchUpdates) are only retried when Google rejected them unprocessed
+    (429 / rate-limit 403), and otherwise raise to the caller, since after a
+    timeout or 5xx the write may already have been applied
+  - counts calls, quota units, retries and failures per API (see usage_summary)
+
+The limiter and counters are process-wide, so every Streamlit session and
+every robot thread shares the same budget.
+
+Use the factories instead of building clients directly:
+    gc = sheets_client_from_dict(creds_dict)       # gspread client
+    service = gmail_service(creds)                 # googleapiclient Gmail service
+
+With EMG_REPLAY_DIR set, both factories return the in-memory fakes from
+emg/fakes.py instead (see emg/replay.py), and no Google API is touched.
+"""
+import os
+import random
+import socket
+import threading
+import time
+
+import gspread
+import requests
+from googleapiclient.discovery import build
+from googleapiclient.errors import HttpError
+from googleapiclient.http import HttpRequest
+
+# (tokens per second, burst capacity). Gmail is metered in quota units
+# (250/user/sec); Sheets allows 60 requests/user/minute.
+RATE_LIMITS = {
+    'gmail': (250.0, 250),
+    'sheets': (1.0, 20),
+    'drive': (10.0, 20),
+}
+
+# Gmail quota units per method; anything unlisted counts as 5
+GMAIL_METHOD_COSTS = {
+    'gmail.users.getProfile': 1,
+    'gmail.users.history.list': 2,
+    'gmail.users.messages.list': 5,
+    'gmail.users.messages.get': 5,
+}
+GMAIL_MESSAGE_GET_COST = GMAIL_METHOD_COSTS['gmail.users.messages.get']
+
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+MAX_RETRIES = 5
+BACKOFF_BASE = 1.0   # seconds
+BACKOFF_CAP = 32.0   # seconds
+
+
+class TokenBucket:
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, tokens=1):
+        """Blocks until `tokens` are available (a cost above capacity waits for a full bucket)."""
+        tokens = min(tokens, self.capacity)
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                wait = (tokens - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class QuotaTracker:
+    FIELDS = ('calls', 'units', 'retries', 'throttled', 'failures')
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counts = {}
+        self.first_call_at = None  # time.perf_counter() of the first API call
+
+    def mark_call(self):
+        if self.first_call_at is None:
+            self.first_call_at = time.perf_counter()
+
+    def add(self, api, **deltas):
+        with self.lock:
+            counts = self.counts.setdefault(api, dict.fromkeys(self.FIELDS, 0))
+            for field, delta in deltas.items():
+                counts[field] += delta
+
+    def snapshot(self):
+        with self.lock:
+            return {api: dict(counts) for api, counts in self.counts.items()}
+
+
+_buckets = {api: TokenBucket(rate, capacity) for api, (rate, capacity) in RATE_LIMITS.items()}
+quota = QuotaTracker()
+
+
+# --- RETRY CLASSIFICATION ---
+def _status_of(exc):
+    if isinstance(exc, HttpError):
+        return exc.resp.status
+    # gspread.exceptions.APIError carries the requests.Response
+    response = getattr(exc, 'response', None)
+    return getattr(response, 'status_code', None)
+
+
+def _rejected_by_quota(exc):
+    """429, or Gmail's per-user throttling (403 rateLimitExceeded): nothing was executed."""
+    status = _status_of(exc)
+    return status == 429 or (status == 403 and 'ratelimitexceeded' in str(exc).lower())
+
+
+def is_retryable(exc, idempotent=True):
+    if _rejected_by_quota(exc):
+        return True
+    if not idempotent:
+        # The request may have been applied before the connection dropped / the 5xx
+        return False
+    if isinstance(exc, (ConnectionError, TimeoutError, socket.timeout, requests.exceptions.ConnectionError)):
+        return True
+    return _status_of(exc) in RETRYABLE_STATUSES
+
+
+# POSTs that only read, or overwrite fixed ranges, so repeating them is harmless
+_IDEMPOTENT_POSTS = (':batchGet', ':batchGetByDataFilter', 'values:batchUpdate', 'values:batchClear')
+
+
+def is_idempotent(method, url):
+    """False for requests that would apply twice if repeated (values:append, spreadsheets:batchUpdate)."""
+    if str(method).upper() in ('GET', 'HEAD', 'PUT', 'DELETE'):
+        return True
+    return str(url).split('?')[0].endswith(_IDEMPOTENT_POSTS)
+
+
+def is_throttled(exc):
+    return _rejected_by_quota(exc)
+
+
+def _retry_after(exc):
+    if isinstance(exc, HttpError):
+        value = exc.resp.get('retry-after')
+    else:
+        response = getattr(exc, 'response', None)
+        value = response.headers.get('Retry-After') if response is not None else None
+    try:
+        return float(value) if value else None
+    except ValueError:
+        return None
+
+
+def backoff_delay(attempt, exc=None):
+    """Full-jitter exponential backoff, but never sooner than Retry-After."""
+    delay = random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * (2 ** attempt)))
+    retry_after = _retry_after(exc) if exc is not None else None
+    return max(delay, retry_after or 0)
+
+
+def acquire(api, cost=1):
+    _buckets[api].acquire(cost)
+
+
+def call_with_retry(api, fn, cost=1, idempotent=True):
+    """
+    Runs fn() under the api's rate limit, retrying transient failures. Pass
+    idempotent=False for writes that must not be repeated blindly; they are
+    only retried when Google rejected them without executing them.
+    """
+    for attempt in range(MAX_RETRIES + 1):
+        acquire(api, cost)
+        quota.mark_call()
+        quota.add(api, calls=1, units=cost)
+        try:
+            return fn()
+        except Exception as e:
+            if not is_retryable(e, idempotent) or attempt == MAX_RETRIES:
+                quota.add(api, failures=1)
+                raise
+            quota.add(api, retries=1, throttled=int(is_throttled(e)))
+            time.sleep(backoff_delay(attempt, e))
+
+
+def usage_summary():
+    """One line per API, e.g. 'gmail: 12 calls, 58 units, 1 retries (1 throttled), 0 failures'."""
+    lines = []
+    for api, c in sorted(quota.snapshot().items()):
+        lines.append(f"{api}: {c['calls']} calls, {c['units']} units, "
+                     f"{c['retries']} retries ({c['throttled']} throttled), {c['failures']} failures")
+    return lines
+
+
+# --- GMAIL ---
+class QuotaHttpRequest(HttpRequest):
+    """googleapiclient request whose execute() goes through call_with_retry."""
+
+    def execute(self, http=None, num_retries=0):
+        cost = GMAIL_METHOD_COSTS.get(self.methodId, 5)
+        return call_with_retry(
+            'gmail',
+            lambda: HttpRequest.execute(self, http=http, num_retries=num_retries),
+            cost=cost,
+            idempotent=is_idempotent(self.method, self.uri),
+        )
+
+
+def replay_dir():
+    return os.environ.get('EMG_REPLAY_DIR')
+
+
+def gmail_service(creds):
+    if replay_dir():
+        from emg.fakes import fake_gmail_service
+        return fake_gmail_service(replay_dir())
+    # static_discovery: use the discovery document bundled with
+    # google-api-python-client instead of fetching it on every cold start
+    return build('gmail', 'v1', credentials=creds, requestBuilder=QuotaHttpRequest,
+                 static_discovery=True, cache_discovery=False)
+
+
+# --- SHEETS / DRIVE (gspread) ---
+class QuotaHTTPClient(gspread.http_client.HTTPClient):
+    """gspread transport that rate-limits every Sheets and Drive call and retries the safe ones."""
+
+    def request(self, *args, **kwargs):
+        method = kwargs.get('method', args[0] if args else "GET")
+        endpoint = kwargs.get('endpoint', args[1] if len(args) > 1 else "")
+        api = 'drive' if 'googleapis.com/drive' in str(endpoint) else 'sheets'
+        return call_with_retry(api, lambda: super(QuotaHTTPClient, self).request(*args, **kwargs),
+                               idempotent=is_idempotent(method, endpoint))
+
+
+def sheets_client_from_dict(creds_dict):
+    if replay_dir():
+        from emg.fakes import fake_sheets_client
+        return fake_sheets_client(replay_dir())
+    gc = gspread.service_account_from_dict(creds_dict, http_client=QuotaHTTPClient)
+    # Refresh-ahead: once the token is close to expiry, google-auth mints the
+    # next one in the background while requests keep using the current one
+    gc.http_client.auth.with_non_blocking_refresh()
+    return gc
@@ -0,0 +1,325 @@
+"""
+Local mirror of the Google Sheets tabs the dashboards read.
+
+Each mirrored tab is stored in a SQLite file (EMG_MIRROR_DIR, default
+<repo>/.mirror) as its rows of cell values, plus when it was last synced.
+Pages read the mirror only; the Sheets API is touched by the Refresher:
+
+  - a daemon thread that re-syncs every mirrored spreadsheet every
+    REFRESH_INTERVAL seconds, one values:batchGet per spreadsheet
+  - refresh(sheet, tabs) for an immediate sync (after a write, or the very
+    first read of a tab that isn't mirrored yet), or refresh_in_background()
+    for one nobody has to wait on (refresh buttons)
+
+A tab outside the mirrored ones that gets synced this way (e.g. a fallback
+tab name) is kept fresh by the daemon thread from then on.
+
+Refreshes are single-flight per tab: a request for a tab that is already
+being fetched (at least as fully) waits for that fetch instead of issuing
+its own, so API load stays flat however many sessions ask at once. A full
+refresh of a tab that was fully reloaded less than `min_age` seconds ago is
+skipped (the debounce for refresh buttons).
+
+It also remembers the last error per spreadsheet, so pages can say how
+fresh what they show is.
+
+Rows are kept as the JSON-encoded lists get_all_values returns; the typed
+DataFrames are built from them by the loaders in emg/data.py.
+
+The tabs are append-only in practice, so a refresh only downloads rows from
+the last TAIL_ROWS already mirrored onwards (A{n-TAIL_ROWS+1}:<last column>).
+If those overlapping rows no longer match the stored checksum, something was
+edited or deleted and the tab is reloaded in full; every tab is also fully
+reloaded at least every FULL_RELOAD_INTERVAL seconds, to pick up edits
+further up and new columns.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+
+import gspread
+from gspread.utils import absolute_range_name, fill_gaps, rowcol_to_a1
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_MIRROR_DIR = os.path.join(ROOT, ".mirror")
+MIRROR_FILE = "sheets_mirror.sqlite"
+
+REFRESH_INTERVAL = 60  # seconds
+FULL_RELOAD_INTERVAL = 3600  # seconds
+TAIL_ROWS = 20  # rows re-read (and checksummed) on each incremental refresh
+
+SCHEMA_VERSION = 2
+
+
+def tail_checksum(rows):
+    """Checksum of rows, ignoring trailing empty cells (the API drops them)."""
+    normalized = []
+    for row in rows:
+        row = list(row)
+        while row and row[-1] == "":
+            row.pop()
+        normalized.append(row)
+    return hashlib.sha1(json.dumps(normalized).encode('utf-8')).hexdigest()
+
+
+def _column_letter(n):
+    return rowcol_to_a1(1, n).rstrip('0123456789')
+
+
+class Mirror:
+    """SQLite store of tab values. Safe to share between threads."""
+
+    def __init__(self, path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            if conn.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+                # It's only a cache: start over rather than migrate
+                conn.execute("DROP TABLE IF EXISTS tabs")
+                conn.execute("DROP TABLE IF EXISTS rows")
+                conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS tabs ("
+                "sheet TEXT, worksheet TEXT, synced_at REAL, full_synced_at REAL, "
+                "n_rows INTEGER, n_cols INTEGER, checksum TEXT, PRIMARY KEY (sheet, worksheet))"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS rows ("
+                "sheet TEXT, worksheet TEXT, row_number INTEGER, data TEXT, PRIMARY KEY (sheet, worksheet, row_number))"
+            )
+
+    def _connect(self):
+        # One connection per call: sqlite3 connections can't cross threads
+        return sqlite3.connect(self.path, timeout=30)
+
+    def synced_at(self, sheet_name, worksheet_name):
+        """When the tab was last synced (time.time()), or None if never."""
+        with self._connect() as conn:
+            row = conn.execute("SELECT synced_at FROM tabs WHERE sheet = ? AND worksheet = ?",
+                               (sheet_name, worksheet_name)).fetchone()
+        return row[0] if row else None
+
+    def tab_info(self, sheet_name, worksheet_name):
+        """{'n_rows', 'n_cols', 'checksum', 'synced_at', 'full_synced_at'} of a synced tab, or None."""
+        fields = ['n_rows', 'n_cols', 'checksum', 'synced_at', 'full_synced_at']
+        with self._connect() as conn:
+            row = conn.execute(f"SELECT {', '.join(fields)} FROM tabs WHERE sheet = ? AND worksheet = ?",
+                               (sheet_name, worksheet_name)).fetchone()
+        return dict(zip(fields, row)) if row else None
+
+    def read(self, sheet_name, worksheet_name):
+        """The tab's values (header row included), or None if it was never synced."""
+        with self._connect() as conn:
+            if not conn.execute("SELECT 1 FROM tabs WHERE sheet = ? AND worksheet = ?",
+                                (sheet_name, worksheet_name)).fetchone():
+                return None
+            rows = conn.execute("SELECT data FROM rows WHERE sheet = ? AND worksheet = ? ORDER BY row_number",
+                                (sheet_name, worksheet_name))
+            return [json.loads(r[0]) for r in rows]
+
+    def write(self, sheet_name, worksheet_name, values):
+        """Replaces the tab's rows in one transaction."""
+        with self._connect() as conn:
+            conn.execute("DELETE FROM rows WHERE sheet = ? AND worksheet = ?", (sheet_name, worksheet_name))
+            conn.executemany(
+                "INSERT INTO rows (sheet, worksheet, row_number, data) VALUES (?, ?, ?, ?)",
+                [(sheet_name, worksheet_name, i, json.dumps(row)) for i, row in enumerate(values, start=1)],
+            )
+            now = time.time()
+            conn.execute(
+                "INSERT OR REPLACE INTO tabs (sheet, worksheet, synced_at, full_synced_at, n_rows, n_cols, checksum) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (sheet_name, worksheet_name, now, now, len(values), max((len(r) for r in values), default=0),
+                 tail_checksum(values[-TAIL_ROWS:])),
+            )
+
+    def append(self, sheet_name, worksheet_name, rows, checksum):
+        """Adds rows after the tab's last one and records the new tail checksum."""
+        with self._connect() as conn:
+            n_rows = conn.execute("SELECT n_rows FROM tabs WHERE sheet = ? AND worksheet = ?",
+                                  (sheet_name, worksheet_name)).fetchone()[0]
+            conn.executemany(
+                "INSERT INTO rows (sheet, worksheet, row_number, data) VALUES (?, ?, ?, ?)",
+                [(sheet_name, worksheet_name, i, json.dumps(row)) for i, row in enumerate(rows, start=n_rows + 1)],
+            )
+            conn.execute(
+                "UPDATE tabs SET synced_at = ?, n_rows = ?, checksum = ? WHERE sheet = ? AND worksheet = ?",
+                (time.time(), n_rows + len(rows), checksum, sheet_name, worksheet_name),
+            )
+
+
+class Refresher:
+    """Keeps `tabs` ({spreadsheet name: [tab names]}) in sync with the mirror."""
+
+    def __init__(self, pool, mirror, tabs, interval=REFRESH_INTERVAL):
+        self.pool = pool
+        self.mirror = mirror
+        self.tabs = {sheet_name: list(names) for sheet_name, names in tabs.items()}
+        self.interval = interval
+        self.lock = threading.Lock()          # one fetch + apply at a time
+        self.flights_lock = threading.Lock()
+        self.flights = {}                     # (sheet, tab) -> (Future, full) of the fetch in flight
+        self.thread = None
+        self.errors = {}  # spreadsheet name -> (time.time(), message) of its last failed refresh
+
+    def plan(self, sheet_name, worksheet_name, full=False):
+        """First row to download for a tab, or None for a full reload."""
+        info = self.mirror.tab_info(sheet_name, worksheet_name)
+        if (full or not info or not info['n_rows'] or not info['n_cols']
+                or time.time() - (info['full_synced_at'] or 0) >= FULL_RELOAD_INTERVAL):
+            return None
+        return max(1, info['n_rows'] - TAIL_ROWS + 1)
+
+    def fetch(self, sheet_name, plans):
+        """
+        {tab: values} for {tab: first row or None} of one spreadsheet, in one
+        values:batchGet. Partial reads are padded to the mirrored width.
+        """
+        ranges, widths = [], {}
+        for name, start in plans.items():
+            if start is None:
+                ranges.append(absolute_range_name(name))
+            else:
+                widths[name] = self.mirror.tab_info(sheet_name, name)['n_cols']
+                ranges.append(absolute_range_name(name, f"A{start}:{_column_letter(widths[name])}"))
+        sh = self.pool.spreadsheet(sheet_name)
+        resp = sh.values_batch_get(ranges)
+        return {name: fill_gaps(vr['values'], cols=widths.get(name)) if vr.get('values') else []
+                for name, vr in zip(plans, resp.get('valueRanges', []))}
+
+    def apply(self, sheet_name, worksheet_name, start, values):
+        """Stores fetched values; False if an incremental read shows the tab was edited."""
+        if start is None:
+            self.mirror.write(sheet_name, worksheet_name, values)
+            return True
+        info = self.mirror.tab_info(sheet_name, worksheet_name)
+        n_overlap = info['n_rows'] - start + 1
+        overlap, new_rows = values[:n_overlap], values[n_overlap:]
+        if len(overlap) < n_overlap or tail_checksum(overlap) != info['checksum']:
+            return False
+        self.mirror.append(sheet_name, worksheet_name, new_rows, tail_checksum((overlap + new_rows)[-TAIL_ROWS:]))
+        return True
+
+    def is_refreshing(self, sheet_name, worksheet_name):
+        return (sheet_name, worksheet_name) in self.flights
+
+    def refresh(self, sheet_name, worksheet_names=None, full=False, min_age=0):
+        """
+        Syncs tabs of one spreadsheet now (all its mirrored tabs by default):
+        only new rows, unless `full` or a tab turns out to have been edited.
+        Tabs already being fetched are waited for rather than fetched again.
+        With `full`, tabs fully reloaded less than `min_age` seconds ago are skipped.
+        """
+        worksheet_names = list(worksheet_names or self.tabs.get(sheet_name, []))
+        if full and min_age:
+            now = time.time()
+            worksheet_names = [name for name in worksheet_names
+                               if now - ((self.mirror.tab_info(sheet_name, name) or {}).get('full_synced_at') or 0) >= min_age]
+
+        waiting, mine = [], []
+        flight = Future()
+        with self.flights_lock:
+            for name in worksheet_names:
+                other = self.flights.get((sheet_name, name))
+                if other and (other[1] or not full):
+                    waiting.append(other[0])
+                else:
+                    mine.append(name)
+                    self.flights[(sheet_name, name)] = (flight, full)
+
+        if mine:
+            try:
+                self._refresh(sheet_name, mine, full)
+            except Exception as e:
+                self.errors[sheet_name] = (time.time(), str(e))
+                flight.set_exception(e)
+            else:
+                self.errors.pop(sheet_name, None)
+                self._keep_fresh(sheet_name, mine)
+                flight.set_result(None)
+            finally:
+                with self.flights_lock:
+                    for name in mine:
+                        if self.flights.get((sheet_name, name), (None,))[0] is flight:
+                            del self.flights[(sheet_name, name)]
+
+        # Re-raises the failure of our fetch or of one we waited for
+        if mine:
+            flight.result()
+        for other in waiting:
+            other.result()
+
+    def _keep_fresh(self, sheet_name, worksheet_names):
+        """Adds tabs synced on demand, and now in the mirror, to the periodic refresh."""
+        with self.flights_lock:
+            known = self.tabs.setdefault(sheet_name, [])
+            known += [name for name in worksheet_names
+                      if name not in known and self.mirror.tab_info(sheet_name, name)]
+
+    def refresh_in_background(self, sheet_name, worksheet_names=None, full=False, min_age=0):
+        """Same as refresh(), on a new thread (returned, already started)."""
+        def run():
+            try:
+                self.refresh(sheet_name, worksheet_names, full, min_age)
+            except Exception as e:
+                print(f"⚠️ Mirror refresh of {sheet_name} failed: {e}")
+
+        thread = threading.Thread(target=run, name="sheets-mirror-refresh", daemon=True)
+        thread.start()
+        return thread
+
+    def _refresh(self, sheet_name, worksheet_names, full):
+        with self.lock:
+            plans = {name: self.plan(sheet_name, name, full) for name in worksheet_names}
+            while plans:
+                try:
+                    fetched = self.fetch(sheet_name, plans)
+                except gspread.exceptions.APIError:
+                    if len(plans) == 1:
+                        raise
+                    # One missing tab fails the whole batch; sync the others one by one
+                    fetched = {}
+                    for name, start in plans.items():
+                        try:
+                            fetched.update(self.fetch(sheet_name, {name: start}))
+                        except gspread.exceptions.APIError as e:
+                            print(f"⚠️ Mirror: can't read {sheet_name} / {name}: {e}")
+                edited = [name for name, values in fetched.items()
+                          if not self.apply(sheet_name, name, plans[name], values)]
+                # Edited tabs: one more round, this time in full
+                plans = {name: None for name in edited}
+
+    def refresh_stale(self):
+        now = time.time()
+        with self.flights_lock:
+            tabs = {sheet_name: list(names) for sheet_name, names in self.tabs.items()}
+        for sheet_name, worksheet_names in tabs.items():
+            stale = [name for name in worksheet_names
+                     if now - (self.mirror.synced_at(sheet_name, name) or 0) >= self.interval]
+            if not stale:
+                continue
+            try:
+                self.refresh(sheet_name, stale)
+            except Exception as e:
+                print(f"⚠️ Mirror refresh of {sheet_name} failed: {e}")
+
+    def run(self):
+        while True:
+            time.sleep(self.interval / 4)
+            self.refresh_stale()
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run, name="sheets-mirror", daemon=True)
+            self.thread.start()
+        return self
+
+
+def open_mirror(mirror_dir=None):
+    mirror_dir = mirror_dir or os.environ.get('EMG_MIRROR_DIR', DEFAULT_MIRROR_DIR)
+    return Mirror(os.path.join(mirror_dir, MIRROR_FILE))
@@ -0,0 +1,40 @@
+"""
+Money as integer cents.
+
+Amounts are read into int cents once (the robot's parser, the dashboards'
+typed loaders in emg/schema.py), added up as integers, and only turned back
+into text at the edges: written to the sheet, or shown on a page.
+"""
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+
+
+def parse_cents(text):
+    """'$1,234.50' -> 123450. Raises ValueError if it isn't an amount."""
+    clean = str(text).replace('$', '').replace(',', '').strip()
+    try:
+        return int((Decimal(clean) * 100).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+    except InvalidOperation:
+        raise ValueError(f"not an amount: {text!r}")
+
+
+def _split(cents):
+    cents = int(cents)
+    return ("-" if cents < 0 else ""), abs(cents) // 100, abs(cents) % 100
+
+
+def plain(cents):
+    """123450 -> '1234.50'."""
+    sign, units, rest = _split(cents)
+    return f"{sign}{units}.{rest:02d}"
+
+
+def sheet_text(cents):
+    """123450 -> '1,234.50', the way amounts are written to the Payments tab."""
+    sign, units, rest = _split(cents)
+    return f"{sign}{units:,}.{rest:02d}"
+
+
+def money(cents):
+    """123450 -> '$1,234.50'."""
+    sign, units, rest = _split(cents)
+    return f"{sign}${units:,}.{rest:02d}"
@@ -0,0 +1,125 @@
+"""
+Offline replay harness: run the sync robot or the dashboards against fixture
+files instead of Google.
+
+    # capture real data into fixtures (needs GMAIL_TOKEN and GCP_JSON, like the robot)
+    python -m emg.replay record --out my_fixtures
+
+    # run the sync pipeline offline, with 100x the fixture volume
+    python -m emg.replay sync --fixtures my_fixtures --scale 100 [-- --backfill --since 2024-01-01]
+
+    # render every page headless (Streamlit AppTest) against the fixtures
+    python -m emg.replay pages --fixtures my_fixtures --scale 10
+
+--latency-ms adds a delay per fake API call to approximate real round-trips.
+Without --fixtures the small sample in emg/fixtures/replay is used;
+emg/fixtures/replay_one_to_one is the same data with only one encounter type
+per London fee.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SAMPLE_FIXTURES = os.path.join(ROOT, "emg", "fixtures", "replay")
+PAGES = ["Home.py"] + [os.path.join("pages", p) for p in sorted(os.listdir(os.path.join(ROOT, "pages"))) if p.endswith(".py")]
+
+SPREADSHEETS = ["EMG Payments Kitchener", "Tugolov combined questionnaire(Responses)"]
+GMAIL_QUERY = 'subject:"Interac e-Transfer" "deposited"'
+
+
+def _use_fixtures(args):
+    os.environ['EMG_REPLAY_DIR'] = os.path.abspath(args.fixtures)
+    os.environ['EMG_REPLAY_SCALE'] = str(args.scale)
+    os.environ['EMG_REPLAY_LATENCY_MS'] = str(args.latency_ms)
+
+
+def _print_fake_calls():
+    from emg.fakes import _instances
+    for (kind, _, _), fake in sorted(_instances.items(), key=lambda kv: kv[0][0]):
+        calls = fake.mailbox.calls if kind == 'gmail' else fake.calls
+        print(f"📞 {kind}: {sum(calls.values())} calls {dict(calls)}")
+
+
+def cmd_record(args):
+    sys.path.insert(0, os.path.join(ROOT, "automation"))
+    from sync_robot import get_gmail_service
+    from emg.fakes import record_gmail, record_spreadsheet
+    from emg.google_api import sheets_client_from_dict
+
+    service = get_gmail_service()
+    if service:
+        print(f"📧 Recorded {record_gmail(service, args.out, GMAIL_QUERY, args.limit)} emails")
+    gc = sheets_client_from_dict(json.loads(os.environ['GCP_JSON']))
+    for title in SPREADSHEETS:
+        print(f"📄 Recorded {title}: {record_spreadsheet(gc, title, args.out)}")
+
+
+def cmd_sync(args):
+    _use_fixtures(args)
+    # Keep the replay's dedup index and mail archive away from the real ones
+    os.environ['SYNC_CACHE_DIR'] = tempfile.mkdtemp(prefix="emg-replay-")
+    os.environ['MAIL_ARCHIVE_DIR'] = os.environ['SYNC_CACHE_DIR']
+    sys.path.insert(0, os.path.join(ROOT, "automation"))
+    import sync_robot
+
+    sys.argv = ["sync_robot.py"] + args.robot_args
+    start = time.perf_counter()
+    try:
+        sync_robot.main()
+    finally:
+        print(f"⏱️ Sync took {time.perf_counter() - start:.2f}s at scale {args.scale}")
+        _print_fake_calls()
+
+
+def cmd_pages(args):
+    _use_fixtures(args)
+    # Start from an empty mirror, away from the real one
+    os.environ['EMG_MIRROR_DIR'] = tempfile.mkdtemp(prefix="emg-replay-mirror-")
+    from streamlit.testing.v1 import AppTest
+
+    failures = 0
+    for page in PAGES:
+        at = AppTest.from_file(os.path.join(ROOT, page), default_timeout=600)
+        at.secrets["gcpjson"] = "{}"
+        start = time.perf_counter()
+        at.run()
+        elapsed = time.perf_counter() - start
+        errors = [e.value for e in at.exception] + [e.value for e in at.error]
+        failures += bool(errors)
+        status = "❌" if errors else "✅"
+        print(f"{status} {page}: {elapsed:.2f}s" + (f" {errors}" if errors else ""))
+    _print_fake_calls()
+    sys.exit(1 if failures else 0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline replay harness for the EMG robot and dashboards.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    rec = sub.add_parser("record", help="Capture real Gmail / Sheets data into fixture files.")
+    rec.add_argument("--out", required=True)
+    rec.add_argument("--limit", type=int, default=500, help="Max emails to record.")
+    rec.set_defaults(func=cmd_record)
+
+    for name, func, help_text in [("sync", cmd_sync, "Run the sync robot against fixtures."),
+                                  ("pages", cmd_pages, "Render every page against fixtures.")]:
+        p = sub.add_parser(name, help=help_text)
+        p.add_argument("--fixtures", default=SAMPLE_FIXTURES)
+        p.add_argument("--scale", type=int, default=1, help="Replicate fixture data this many times.")
+        p.add_argument("--latency-ms", type=float, default=0, help="Simulated delay per API call.")
+        if name == "sync":
+            p.add_argument("robot_args", nargs=argparse.REMAINDER, help="Arguments passed to sync_robot.py after --.")
+        p.set_defaults(func=func)
+
+    args = parser.parse_args()
+    if getattr(args, "robot_args", None) and args.robot_args[0] == "--":
+        args.robot_args = args.robot_args[1:]
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""
+Declared column types of the dashboard tabs.
+
+Sheets hands back every cell as a string; each tab's schema says what its
+columns are, and apply() converts a tab's values once, when its DataFrame is
+built (emg/data.py caches the result until the mirrored rows change):
+  - CENTS:    money as int64 cents ('$1,234.50' -> 123450), by the same exact
+              rules as emg.money.parse_cents; blanks and unreadable cells
+              become 0, and how many were unreadable is reported as drift
+  - DATETIME: parsed (emg/dates.py) into a datetime64 'Date Object' column;
+              the text column is kept as written, for display, and how many
+              rows have no readable date is in df.attrs['unreadable_dates']
+  - CATEGORY: repeated labels (doctors, categories, locations)
+  - TEXT:     left as is
+
+drift() reports differences between the sheet's header row and the schema:
+repeated headers (only the first such column is kept), declared columns that
+are missing, and columns the schema doesn't know (kept, as text). apply()
+adds the amounts it couldn't read to df.attrs['drift'].
+"""
+from emg import dates
+from emg.money import parse_cents
+
+TEXT = "text"
+CATEGORY = "category"
+DATETIME = "datetime"
+CENTS = "cents"
+
+DATE_OBJECT = "Date Object"
+
+
+class Schema:
+    def __init__(self, name, columns, header=None, optional=(), dayfirst=True):
+        self.name = name
+        self.columns = dict(columns)  # column -> kind, in sheet order
+        # Header row the tab is expected to have, if it isn't the columns
+        # themselves (Expenses rows are reshaped before typing)
+        self.header = list(header or self.columns)
+        self.optional = set(optional)
+        self.dayfirst = dayfirst
+
+
+PAYMENTS = Schema("Payments", [
+    ("Date", DATETIME),  # dd/mm/yyyy hh:mm:ss, written by sync_robot.py
+    ("Sender", CATEGORY),
+    ("Amount", CENTS),
+    ("Doctor", CATEGORY),
+    ("Message ID", TEXT),
+])
+
+EXPENSES = Schema("Expenses", [
+    ("Date", DATETIME),  # yyyy-mm-dd (str(date), written by the Expense Tracker)
+    ("Category", CATEGORY),
+    ("Amount", CENTS),
+    ("Location", CATEGORY),
+    ("Description", TEXT),
+    ("Receipt", TEXT),
+], header=["Timestamp", "Date", "Category", "Amount", "Location", "Receipt"], dayfirst=False)
+
+WORK_LOG = Schema("Work_Log", [
+    ("Date Worked", DATETIME),  # yyyy-mm-dd
+    ("Event Name", CATEGORY),
+    ("Doctor", CATEGORY),
+], dayfirst=False)
+
+LONDON = Schema("London responses", [
+    ("Timestamp", DATETIME),  # Google Forms, dd/mm/yyyy h:mm:ss
+    ("Patient initials", TEXT),
+    ("Type of encounter", CATEGORY),
+    ("Amount", CENTS),
+], optional=["Amount"])
+
+
+def _cents_or_none(text):
+    try:
+        return parse_cents(text)
+    except ValueError:
+        return None
+
+
+def to_cents(series):
+    """
+    '$1,234.50' -> 123450 (int64) -> (Series, number of unreadable cells).
+    Each distinct text is parsed once; blanks and unreadable cells become 0.
+    """
+    text = series.fillna('').astype(str).str.strip()
+    parsed = {t: (_cents_or_none(t) if t else 0) for t in text.unique()}
+    n_bad = int(text.map(lambda t: parsed[t] is None).sum())
+    return text.map(lambda t: parsed[t] or 0).astype('int64'), n_bad
+
+
+def drift(header, schema):
+    """Human-readable differences between a tab's header row and its schema."""
+    header = [h.strip() for h in header]
+    problems = []
+    for name in dict.fromkeys(header):
+        if header.count(name) > 1:
+            problems.append(f"column '{name}' appears {header.count(name)} times; only the first is used")
+    for name in schema.header:
+        if name not in header and name not in schema.optional:
+            problems.append(f"expected column '{name}' is missing")
+    for name in dict.fromkeys(header):
+        if name not in schema.header and name not in schema.columns:
+            problems.append(f"unexpected column '{name}'" if name else "a column has no header")
+    return problems
+
+
+def apply(df, schema):
+    """Converts the schema's columns of df (string cells) to their types, in place."""
+    for name, kind in schema.columns.items():
+        if name not in df.columns:
+            continue
+        if kind == CENTS:
+            df[name], n_bad = to_cents(df[name])
+            if n_bad:
+                df.attrs.setdefault('drift', []).append(f"{n_bad} '{name}' cells aren't amounts and count as $0")
+        elif kind == CATEGORY:
+            df[name] = df[name].astype('category')
+        elif kind == DATETIME:
+            df[DATE_OBJECT], df.attrs['unreadable_dates'] = dates.parse(
+                df[name], dayfirst=schema.dayfirst, key=(schema.name, name))
+    return df
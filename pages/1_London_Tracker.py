@@ -1,34 +1,13 @@
 import streamlit as st
 import gspread
+from emg import data
 import pandas as pd
-import json
 import io
 
-def get_google_sheet_df(sheet_name, worksheet_name):
-    """
-    Fetch data from Google Sheet with proper credential handling
-    """
+def get_london_df():
+    """London questionnaire responses; an empty frame (and a message) on errors."""
     try:
-        # Load credentials from Streamlit secrets
-        creds_dict = json.loads(st.secrets["gcpjson"])
-        
-        # Create gspread client with service account
-        gc = gspread.service_account_from_dict(creds_dict)
-        
-        # Open the spreadsheet and worksheet
-        sh = gc.open(sheet_name)
-        worksheet = sh.worksheet(worksheet_name)
-        
-        # Get all data
-        data = worksheet.get_all_values()
-        
-        # Create DataFrame
-        if len(data) > 0:
-            headers = data[0]
-            df = pd.DataFrame(data[1:], columns=headers)
-            return df
-        else:
-            return pd.DataFrame()
+        return data.load_london()
             
     except gspread.exceptions.APIError as e:
         st.error(f"Google Sheets API Error: {str(e)}")
@@ -40,16 +19,13 @@ def get_google_sheet_df(sheet_name, worksheet_name):
         st.info("Please check your credentials and try again.")
         return pd.DataFrame()
 
-# CHANGE THESE for each dashboard:
-SHEET_NAME = "Tugolov combined questionnaire(Responses)"      # <-- update as needed per file
-WORKSHEET_NAME = "Form responses 1"            # <-- update per dashboard/tab
-
 st.title("London Tracker Dashboard")
 if st.button("Refresh Data"):
-    st.cache_data.clear()
+    data.refresh(data.LONDON, full=True)
     st.rerun()
 
-df = get_google_sheet_df(SHEET_NAME, WORKSHEET_NAME)
+df = get_london_df()
+data.show_freshness(data.LONDON)
 
 # --- Earnings Calculation Logic ---
 def calculate_earnings(encounter_type):
@@ -57,21 +33,23 @@ def calculate_earnings(encounter_type):
         return 0
     etype = encounter_type.lower().strip()
     
+    # In cents
     if "follow up" in etype:
-        return 65
+        return 6500
     elif "consult" in etype:
-        return 85
+        return 8500
     else:
         return 0
 
 # Ensure column exists and clean it
 if "Type of encounter" in df.columns:
-    df["Earnings"] = df["Type of encounter"].apply(calculate_earnings)
+    # The column is categorical; map its text so Earnings is always int64 cents
+    df["Earnings"] = df["Type of encounter"].astype(str).map(calculate_earnings).astype("int64")
     
     # --- Date Parsing & Analytics ---
     if "Timestamp" in df.columns:
-        # Convert Timestamp to datetime objects
-        df["Date"] = pd.to_datetime(df["Timestamp"], dayfirst=True, errors='coerce')
+        # Timestamp is already parsed (see data.load_london)
+        df["Date"] = df.pop("Date Object")
         
         # Filter out invalid dates
         df_valid = df.dropna(subset=["Date"]).copy()
@@ -169,23 +147,23 @@ if "Type of encounter" in df.columns:
             
             with left_col:
                 col1, col2, col3 = st.columns(3)
-                col1.metric("💰 Total Earnings", f"${total_earnings:,.2f}")
-                col2.metric("📅 This Quarter", f"${quarterly_earnings:,.2f}")
-                col3.metric("📈 This Year", f"${yearly_earnings:,.2f}")
+                col1.metric("💰 Total Earnings", data.money(total_earnings))
+                col2.metric("📅 This Quarter", data.money(quarterly_earnings))
+                col3.metric("📈 This Year", data.money(yearly_earnings))
             
             with right_col:
                 # Highlighted "This Month" card
                 st.markdown(f"""
                 <div class="highlight-card">
                     <div class="highlight-label">🌟 This Month</div>
-                    <div class="highlight-value">${monthly_earnings:,.2f}</div>
+                    <div class="highlight-value">{data.money(monthly_earnings)}</div>
                 </div>
                 """, unsafe_allow_html=True)
             
             # --- Monthly Trend Chart ---
             st.markdown("### Monthly Earnings Trend")
             # Group by Month-Year for sorting
-            monthly_trend = df_valid.groupby(df_valid["Date"].dt.to_period("M"))["Earnings"].sum()
+            monthly_trend = df_valid.groupby(df_valid["Date"].dt.to_period("M"))["Earnings"].sum() / 100
             monthly_trend.index = monthly_trend.index.strftime('%Y-%m') # Convert to string for chart
             st.bar_chart(monthly_trend, color="#0068c9")
             
@@ -213,7 +191,7 @@ if "Type of encounter" in df.columns:
                 
                 # Show specific metrics for the selection
                 m_col1, m_col2 = st.columns(2)
-                m_col1.metric(f"Earnings ({selected_month})", f"${display_earnings:,.2f}")
+                m_col1.metric(f"Earnings ({selected_month})", data.money(display_earnings))
                 m_col2.metric(f"Encounters ({selected_month})", display_encounters)
 
             # --- Data Styling ---
@@ -230,18 +208,20 @@ if "Type of encounter" in df.columns:
                 return ''
 
             if not filtered_df.empty:
-                styled_df = filtered_df.style.map(highlight_earnings, subset=['Earnings'])\
+                styled_df = filtered_df.style.format({"Earnings": data.money})\
+                                             .map(highlight_earnings, subset=['Earnings'])\
                                              .map(color_encounter_type, subset=['Type of encounter'])
                 st.dataframe(styled_df, use_container_width=True)
             else:
                 st.info("No data available for this selection.")
             
-            # Update download buttons to use filtered data
-            csv = filtered_df.to_csv(index=False).encode("utf-8")
+            # Update download buttons to use filtered data (Earnings in dollars)
+            export_df = filtered_df.assign(Earnings=filtered_df["Earnings"] / 100)
+            csv = export_df.to_csv(index=False).encode("utf-8")
             st.download_button("Download CSV (Filtered)", csv, f"LondonTracker_{selected_month.replace(' ', '_')}.csv", "text/csv")
             
             buffer = io.BytesIO()
-            filtered_df.to_excel(buffer, index=False)
+            export_df.to_excel(buffer, index=False)
             buffer.seek(0)
             st.download_button("Download Excel (Filtered)", buffer, f"LondonTracker_{selected_month.replace(' ', '_')}.xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
             
@@ -1,37 +1,20 @@
 import streamlit as st
-import gspread
+from emg import data
 import pandas as pd
-import json
 import io
 
-@st.cache_data(ttl=60)
-def get_google_sheet_df(sheet_name, worksheet_name):
-    """Fetch data from Google Sheet with proper credential handling"""
+def get_payments_df():
     try:
-        creds_dict = json.loads(st.secrets["gcpjson"])
-        gc = gspread.service_account_from_dict(creds_dict)
-        sh = gc.open(sheet_name)
-        worksheet = sh.worksheet(worksheet_name)
-        data = worksheet.get_all_values()
-        
-        if len(data) > 0:
-            headers = data[0]
-            df = pd.DataFrame(data[1:], columns=headers)
-            return df
-        return pd.DataFrame()
-            
+        return data.load_payments()
     except Exception as e:
         st.error(f"Error loading data: {str(e)}")
         return pd.DataFrame()
 
-SHEET_NAME = "EMG Payments Kitchener"
-WORKSHEET_NAME = "Payments"
-
 st.set_page_config(page_title="Kitchener Finance Dashboard", layout="wide")
 st.title("Kitchener Finance Dashboard")
 
 if st.button("Refresh Data"):
-    st.cache_data.clear()
+    data.refresh(data.PAYMENTS, full=True)
     st.rerun()
 
 # --- CSS Styling ---
@@ -53,33 +36,22 @@ div[data-testid="stMetric"] {
 </style>
 """, unsafe_allow_html=True)
 
-df = get_google_sheet_df(SHEET_NAME, WORKSHEET_NAME)
+df = get_payments_df()
+data.show_freshness(data.PAYMENTS)
 
 # --- Data Cleaning & Filtering ---
 if not df.empty:
-    # 1. FIX: Remove duplicate column names immediately (Required for Streamlit/Arrow)
-    df = df.loc[:, ~df.columns.duplicated()]
-
-    # 2. Filter and RESET INDEX
+    # 1. Filter and RESET INDEX
     # (Removed Tugalov filter as per user request to include all doctors)
     # if 'Doctor' in df.columns:
     #     df = df[~df['Doctor'].str.contains('Tugalov', case=False, na=False)].reset_index(drop=True)
     
-    # 3. Convert Amount to Numeric
-    if 'Amount' in df.columns:
-        df['Amount'] = pd.to_numeric(df['Amount'].astype(str).str.replace('$','').str.replace(',',''), errors='coerce').fillna(0)
-        
-    # 4. Parse Dates
-    if 'Date' in df.columns:
-        df['Date Object'] = pd.to_datetime(df['Date'], errors='coerce', dayfirst=True)
-        # Log warning if dates are dropped
-        n_dropped = df['Date Object'].isna().sum() 
-        if n_dropped > 0:
-            st.warning(f"⚠️ {n_dropped} rows had invalid dates and were excluded.")
-            
+    # 2. Dates (already parsed into 'Date Object' and Amount into cents, see data.load_payments)
+    if 'Date Object' in df.columns:
+        # Rows with invalid dates are excluded (show_freshness warns about them)
         df = df.dropna(subset=['Date Object']).reset_index(drop=True)
         
-        # 5. Sort by Date Descending (Newest First)
+        # 3. Sort by Date Descending (Newest First)
         df = df.sort_values(by='Date Object', ascending=False).reset_index(drop=True)
         
         current_date = pd.Timestamp.now()
@@ -101,29 +73,30 @@ if not df.empty:
         l_col, r_col = st.columns([2, 1])
         with l_col:
             c1, c2 = st.columns(2)
-            c1.metric("💰 Total Earnings", f"${total_earnings:,.2f}")
-            c2.metric("📈 This Year", f"${yearly_earnings:,.2f}")
+            c1.metric("💰 Total Earnings", data.money(total_earnings))
+            c2.metric("📈 This Year", data.money(yearly_earnings))
         with r_col:
-            st.markdown(f'<div class="highlight-card"><div class="highlight-label">🌟 This Month</div><div class="highlight-value">${monthly_earnings:,.2f}</div></div>', unsafe_allow_html=True)
+            st.markdown(f'<div class="highlight-card"><div class="highlight-label">🌟 This Month</div><div class="highlight-value">{data.money(monthly_earnings)}</div></div>', unsafe_allow_html=True)
 
         st.divider()
         st.subheader("📋 Detailed Records")
         
         try:
             # Use map for cell-wise styling
-            styled_df = df.style.format({"Amount": "${:,.2f}"}).map(lambda x: 'color: green; font-weight: bold', subset=['Amount'])
+            styled_df = df.style.format({"Amount": data.money}).map(lambda x: 'color: green; font-weight: bold', subset=['Amount'])
             st.dataframe(styled_df, use_container_width=True, hide_index=True)
         except Exception:
             st.dataframe(df, use_container_width=True, hide_index=True)
 
-        # Downloads
+        # Downloads (Amount in dollars)
+        export_df = df.assign(Amount=df['Amount'] / 100)
         col_down1, col_down2 = st.columns(2)
         with col_down1:
-            csv = df.to_csv(index=False).encode("utf-8")
+            csv = export_df.to_csv(index=False).encode("utf-8")
             st.download_button("📥 Download CSV", csv, "KitchenerFinance.csv", "text/csv")
         with col_down2:
             buffer = io.BytesIO()
-            df.to_excel(buffer, index=False)
+            export_df.to_excel(buffer, index=False)
             buffer.seek(0)
             st.download_button("📥 Download Excel", buffer, "KitchenerFinance.xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
 else:
@@ -1,15 +1,14 @@
 import streamlit as st
 import gspread
-import pandas as pd
+from emg import data
 import json
 from datetime import date, datetime
 import google.generativeai as genai
 from PIL import Image
 
 # --- CONFIGURATION ---
-SHEET_NAME = 'EMG Payments Kitchener'
-CREDENTIALS_FILE = 'credentials.json'
-WORKSHEET_NAME = 'Expenses'
+SHEET_NAME = data.KITCHENER_SHEET
+WORKSHEET_NAME = data.EXPENSES_WORKSHEET
 
 # --- SETUP AI ---
 if "GEMINI_API_KEY" in st.secrets:
@@ -35,81 +34,19 @@ def analyze_receipt(image):
         st.error(f"AI Error: {e}")
         return None
 
-# --- CONNECT TO GOOGLE ---
-@st.cache_resource
-def get_connection():
-    try:
-        if "gcpjson" in st.secrets:
-            creds_dict = json.loads(st.secrets["gcpjson"])
-            gc = gspread.service_account_from_dict(creds_dict)
-        else:
-            # Fallback or error if secrets not found
-            st.error("Secrets 'gcpjson' not found.")
-            st.stop()
-        return gc
-    except Exception as e:
-        st.error(f"❌ Error: {e}")
-        st.stop()
-
-@st.cache_data(ttl=60)
+# --- GOOGLE SHEETS ---
 def get_expense_data():
-    gc = get_connection()
-    sh = gc.open(SHEET_NAME)
     try:
-        worksheet = sh.worksheet(WORKSHEET_NAME)
-        data = worksheet.get_all_values()
-        
-        structured_data = []
-        # Skip header
-        for row in data[1:]:
-            while len(row) < 8: row.append("")
-            
-            # HYBRID LOGIC (Keeps your old history visible)
-            date_val = row[1]
-            cat_val = row[2]
-            amt_val = row[3]
-            loc_val = row[4]
-            desc_val = row[2]
-            receipt_val = row[5]
-
-            # Check for OLD Data (Date in Col A)
-            is_old_data = False
-            try:
-                float(str(row[2]).replace('$','').replace(',',''))
-                if len(str(row[1])) > 0 and not str(row[1])[0].isdigit():
-                    is_old_data = True
-            except:
-                pass
-
-            if is_old_data:
-                date_val = row[0]
-                cat_val = row[1]
-                amt_val = row[2]
-                desc_val = row[3]
-                loc_val = row[5] 
-                receipt_val = ""
-
-            structured_data.append({
-                "Date": date_val,
-                "Category": cat_val,
-                "Amount": amt_val,
-                "Location": loc_val,
-                "Description": desc_val,
-                "Receipt": receipt_val
-            })
-        
-        df = pd.DataFrame(structured_data)
-        return df
+        return data.load_expenses()
     except gspread.exceptions.WorksheetNotFound:
         st.error(f"❌ Tab '{WORKSHEET_NAME}' not found.")
         st.stop()
 
-def add_expense(date_val, category, amount, location, receipt_note):
-    gc = get_connection()
-    sh = gc.open(SHEET_NAME)
-    worksheet = sh.worksheet(WORKSHEET_NAME)
+def add_expense(date_val, category, amount_cents, location, receipt_note):
     timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    worksheet.append_row([timestamp, str(date_val), category, amount, location, receipt_note])
+    # The sheet keeps dollars as a number cell
+    data.append_row(SHEET_NAME, WORKSHEET_NAME, [timestamp, str(date_val), category, amount_cents / 100, location, receipt_note])
+    data.refresh(data.EXPENSES)
 
 # --- DASHBOARD ---
 def main():
@@ -121,7 +58,7 @@ def main():
     st.title("💸 AI Expense Tracker")
     
     if st.button("🔄 Refresh Data"):
-        st.cache_data.clear()
+        data.refresh(data.EXPENSES, full=True)
         st.rerun()
 
     # Initialize Session State
@@ -139,22 +76,22 @@ def main():
             
             if st.button("✨ Extract Data"):
                 with st.spinner("Reading receipt..."):
-                    data = analyze_receipt(Image.open(uploaded_file))
+                    receipt = analyze_receipt(Image.open(uploaded_file))
                     
-                    if data:
+                    if receipt:
                         # Amount
-                        try: st.session_state['form_amount'] = float(str(data.get('Amount', 0)).replace('$','').replace(',',''))
+                        try: st.session_state['form_amount'] = float(str(receipt.get('Amount', 0)).replace('$','').replace(',',''))
                         except: pass
                         
                         # Merchant
-                        st.session_state['form_merch'] = data.get('Merchant', '')
+                        st.session_state['form_merch'] = receipt.get('Merchant', '')
                         
                         # Date
-                        try: st.session_state['form_date'] = datetime.strptime(data.get('Date'), "%Y-%m-%d").date()
+                        try: st.session_state['form_date'] = datetime.strptime(receipt.get('Date'), "%Y-%m-%d").date()
                         except: pass
                         
                         # Category Matching
-                        ai_cat = str(data.get('Category', '')).lower()
+                        ai_cat = str(receipt.get('Category', '')).lower()
                         
                         found_index = 6 
                         if "fuel" in ai_cat or "gas" in ai_cat or "parking" in ai_cat or "travel" in ai_cat: found_index = 0
@@ -187,12 +124,17 @@ def main():
         
         if st.form_submit_button("💾 Save Expense"):
             receipt_note = "AI Scanned" if uploaded_file else "Manual"
-            add_expense(d, c, a, l, f"{desc} ({receipt_note})")
-            st.success("Saved!")
-            st.session_state['form_amount'] = 0.0
-            st.session_state['form_merch'] = ""
-            st.cache_data.clear()
-            st.rerun()
+            try:
+                add_expense(d, c, round(a * 100), l, f"{desc} ({receipt_note})")
+            except Exception as e:
+                # Appends aren't retried blindly: the row may or may not be in
+                data.refresh(data.EXPENSES)
+                st.error(f"❌ Couldn't confirm the expense was saved ({e}). Check the table below before saving it again.")
+            else:
+                st.success("Saved!")
+                st.session_state['form_amount'] = 0.0
+                st.session_state['form_merch'] = ""
+                st.rerun()
 
     st.divider()
 
@@ -201,10 +143,10 @@ def main():
         df = get_expense_data()
     except:
         st.stop()
+    data.show_freshness(data.EXPENSES)
 
     if not df.empty:
-        df['Amount'] = pd.to_numeric(df['Amount'].astype(str).str.replace('$','').str.replace(',',''), errors='coerce').fillna(0)
-        df['Date Object'] = pd.to_datetime(df['Date'], errors='coerce')
+        # Date already parsed into 'Date Object', Amount in cents (see data.load_expenses)
         df = df.dropna(subset=['Date Object'])
         df['Year'] = df['Date Object'].dt.year
         
@@ -214,12 +156,12 @@ def main():
         y_df = df[df['Year'] == sel_year]
         
         m1, m2, m3, m4 = st.columns(4)
-        m1.metric("Total", f"${y_df['Amount'].sum():,.2f}")
-        m2.metric("London", f"${y_df[y_df['Location'].str.contains('London', case=False, na=False)]['Amount'].sum():,.2f}")
-        m3.metric("Kitchener", f"${y_df[y_df['Location'].str.contains('Kitch', case=False, na=False)]['Amount'].sum():,.2f}")
-        m4.metric("General", f"${y_df[y_df['Location'].str.contains('General', case=False, na=False)]['Amount'].sum():,.2f}")
+        m1.metric("Total", data.money(y_df['Amount'].sum()))
+        m2.metric("London", data.money(y_df[y_df['Location'].str.contains('London', case=False, na=False)]['Amount'].sum()))
+        m3.metric("Kitchener", data.money(y_df[y_df['Location'].str.contains('Kitch', case=False, na=False)]['Amount'].sum()))
+        m4.metric("General", data.money(y_df[y_df['Location'].str.contains('General', case=False, na=False)]['Amount'].sum()))
         
-        st.dataframe(y_df.sort_values('Date Object', ascending=False)[["Date", "Category", "Amount", "Location", "Description"]], use_container_width=True, hide_index=True)
+        st.dataframe(y_df.sort_values('Date Object', ascending=False)[["Date", "Category", "Amount", "Location", "Description"]].style.format({"Amount": data.money}), use_container_width=True, hide_index=True)
 
 if __name__ == "__main__":
     main()
@@ -1,43 +1,10 @@
 import streamlit as st
-import gspread
-import pandas as pd
-import json
+from emg import data, dates
 from datetime import datetime, timedelta
 
-# --- CONFIGURATION ---
-SHEET_NAME = 'EMG Payments Kitchener'
-CREDENTIALS_FILE = 'credentials.json'
-
-# --- CONNECT TO GOOGLE ---
-@st.cache_resource
-def get_connection():
-    try:
-        if "gcpjson" in st.secrets:
-            creds_dict = json.loads(st.secrets["gcpjson"])
-            gc = gspread.service_account_from_dict(creds_dict)
-        else:
-            st.error("Secrets 'gcpjson' not found.")
-            st.stop()
-        return gc
-    except Exception as e:
-        st.error(f"❌ Error: {e}")
-        st.stop()
-
 def get_all_data():
-    gc = get_connection()
-    sh = gc.open(SHEET_NAME)
-    
-    # 1. Get Payments (To calc average rate)
-    ws_pay = sh.worksheet("Payments")
-    pay_data = ws_pay.get_all_values()
-    pay_headers = [h.strip() for h in pay_data[0]]
-    df_pay = pd.DataFrame(pay_data[1:], columns=pay_headers)
-    
-    # 2. Get Work Log (To see future dates)
-    ws_work = sh.worksheet("Work_Log")
-    work_data = ws_work.get_all_values()
-    work_headers = [h.strip() for h in work_data[0]]
-    df_work = pd.DataFrame(work_data[1:], columns=work_headers)
+    # Payments (To calc average rate) + Work Log (To see future dates)
+    df_pay, df_work = data.load_kitchener(data.PAYMENTS_WORKSHEET, data.WORK_LOG_WORKSHEET)
     
     return df_pay, df_work
 
@@ -56,19 +23,21 @@ def main():
     except Exception as e:
         st.error(f"Error reading sheet: {e}")
         st.stop()
+    data.show_freshness(data.PAYMENTS, data.WORK_LOG)
 
     if not df_pay.empty and not df_work.empty:
         # --- 1. CALCULATE HISTORICAL AVERAGE ---
-        # Clean Payments
-        df_pay['Amount'] = pd.to_numeric(df_pay['Amount'].astype(str).str.replace('$','').str.replace(',',''), errors='coerce')
-        total_earnings = df_pay['Amount'].sum()
+        # (Payments Amount is in cents, see data.load_payments)
+        total_earnings = int(df_pay['Amount'].sum())
         
         # Clean Work Log
         date_col = 'Date Worked' 
         if 'Date Worked' not in df_work.columns:
              date_col = df_work.columns[0] 
 
-        df_work['Date Object'] = pd.to_datetime(df_work[date_col], errors='coerce')
+        if 'Date Object' not in df_work.columns:
+            # No 'Date Worked' column, so the schema couldn't parse it
+            df_work['Date Object'], _ = dates.parse(df_work[date_col], dayfirst=False)
         df_work = df_work.dropna(subset=['Date Object'])
         
         # Count PAST work days (Unique Dates Only!)
@@ -79,10 +48,10 @@ def main():
         # *** FIX: Count UNIQUE dates so split days count as 1 ***
         days_worked = past_work['Date Object'].dt.date.nunique()
         
-        # Calculate Real Average
+        # Calculate Real Average (cents per day)
         real_avg_rate = 0
         if days_worked > 0:
-            real_avg_rate = total_earnings / days_worked
+            real_avg_rate = total_earnings // days_worked
 
         # --- 2. SIDEBAR CONTROLS ---
         st.sidebar.header("⚙️ Forecast Settings")
@@ -91,7 +60,7 @@ def main():
             "Estimated Daily Income ($)", 
             min_value=500, 
             max_value=3000, 
-            value=int(real_avg_rate) if real_avg_rate > 0 else 1200,
+            value=real_avg_rate // 100 if real_avg_rate > 0 else 1200,
             step=50,
             help="We calculated this baseline from your past payments."
         )
@@ -125,13 +94,13 @@ def main():
         
         # *** FIX: Count UNIQUE future dates ***
         future_days_count = scope_work_filtered['Date Object'].dt.date.nunique()
-        projected_income = future_days_count * use_rate
+        projected_income = future_days_count * use_rate * 100  # cents
         
         # --- 4. VISUALS ---
         m1, m2, m3 = st.columns(3)
         m1.metric("📅 Future Work Days", f"{future_days_count} days", f"Next {months_forward} months")
-        m2.metric("💰 Projected Income", f"${projected_income:,.2f}", f"@ ${use_rate}/day")
-        m3.metric("📉 Historical Avg", f"${real_avg_rate:,.2f}/day", f"Based on {days_worked} past days")
+        m2.metric("💰 Projected Income", data.money(projected_income), f"@ ${use_rate}/day")
+        m3.metric("📉 Historical Avg", f"{data.money(real_avg_rate)}/day", f"Based on {days_worked} past days")
         
         st.divider()
         